@@ -0,0 +1,172 @@
+"""
+Vectorized time alignment of sensor series, e.g. joining impedance sweeps with temperatures.
+
+The source series (e.g. PT100) is interpolated onto the timestamps of the target series
+(e.g. Keysight sweeps) of one session. Both series are streamed in timestamp order batch by batch,
+only the source points around the current target batch are kept in memory.
+
+Methods:
+linear      linear interpolation between the enclosing source points (Helper.map)
+previous    last source value at or before the target timestamp
+nearest     source value closest in time
+
+Target timestamps outside of the source series, or in gaps larger than max_gap seconds, get NaN.
+
+Usage:
+python3 Align.py --user postgres --session 3 --target Keysight --source PT100_D5 --max-gap 600 --out aligned.csv
+"""
+
+import argparse
+import getpass
+import numpy as np
+import Exporter
+import Helper
+import Saver
+
+METHODS = ("linear", "previous", "nearest")
+
+def seconds(timestamps):
+    """Convert datetime64 array to float seconds since epoch."""
+
+    return timestamps.astype("datetime64[s]").astype(np.float64)
+
+def values(data, channel=-1):
+    """
+    Reduce measurement data to one value per timestamp.
+
+    data: np_array[n][channels] (e.g. PT100) or np_array[n][samples][channels] (raw PT100, averaged over samples)
+    """
+
+    if data.ndim == 1:
+        return data.astype(np.float64)
+    if data.ndim == 2:
+        return data[:, channel]
+    return data[:, :, channel].mean(axis=1)
+
+def interpolate(t, source_t, source_v, method="linear", max_gap=None):
+    """
+    Interpolate source series onto timestamps t.
+
+    t, source_t: np_array of float seconds, sorted ascending
+    source_v: np_array of values at source_t
+
+    Return:
+    np_array: values at t, NaN where no source value applies
+    """
+
+    if method not in METHODS:
+        raise ValueError("Unknown method %r, expected one of %s" % (method, ", ".join(METHODS)))
+    out = np.full(len(t), np.nan)
+    if not len(source_t):
+        return out
+    right = np.searchsorted(source_t, t, side="left")
+    left = np.searchsorted(source_t, t, side="right") - 1
+    inside = (left >= 0) & (right < len(source_t))
+    # t on a source timestamp (left > right if the timestamp is duplicated, left is its last occurrence)
+    exact = inside & (left >= right)
+    l = np.clip(left, 0, len(source_t) - 1)
+    r = np.clip(right, 0, len(source_t) - 1)
+    t0, t1 = source_t[l], source_t[r]
+    v0, v1 = source_v[l], source_v[r]
+
+    if method == "previous":
+        valid = left >= 0
+        out[valid] = v0[valid]
+        gap = t - t0
+    elif method == "nearest":
+        # outside the series the nearest point is the first or last one
+        valid = np.ones(len(t), dtype=bool)
+        use_right = (left < 0) | (right < len(source_t)) & (t1 - t < t - t0)
+        out = np.where(use_right, v1, v0)
+        gap = np.where(use_right, t1 - t, t - t0)
+    else:
+        valid = inside
+        between = inside & ~exact
+        out[exact] = v0[exact]
+        out[between] = Helper.map(t[between], t0[between], t1[between], v0[between], v1[between])
+        gap = np.where(exact, 0, t1 - t0)
+    if max_gap is not None:
+        valid = valid & (gap <= max_gap)
+    out[~valid] = np.nan
+    return out
+
+def align(con, session_id, target, source, method="linear", channel=-1, max_gap=None, start=None, stop=None, batch_size=1000):
+    """
+    Stream target measurements of session together with source values aligned to their timestamps.
+
+    channel: column of source data (default last: temperature of PT100, also in raw mode)
+
+    Yield:
+    np_array[n] of datetime64[s] timestamps, np_array target data, np_array[n] aligned source values
+    """
+
+    exporter = Exporter.SessionExporter(con, batch_size)
+    batches = exporter.iter_batches(session_id, source, start, stop)
+    source_t = np.empty(0)
+    source_v = np.empty(0)
+    exhausted = False
+    try:
+        for timestamps, data in exporter.iter_batches(session_id, target, start, stop):
+            t = seconds(timestamps)
+            # read source until it reaches past the last target timestamp (needed for linear and nearest)
+            while not exhausted and (not len(source_t) or source_t[-1] <= t[-1]):
+                batch = next(batches, None)
+                if batch is None:
+                    exhausted = True
+                    break
+                source_t = np.concatenate((source_t, seconds(batch[0])))
+                source_v = np.concatenate((source_v, values(batch[1], channel)))
+            yield timestamps, data, interpolate(t, source_t, source_v, method, max_gap)
+            # keep only the last source point before the next target batch
+            keep = max(np.searchsorted(source_t, t[-1], side="right") - 1, 0)
+            source_t = source_t[keep:]
+            source_v = source_v[keep:]
+    finally:
+        batches.close()
+
+def to_csv(con, session_id, target, source, path, method="linear", channel=-1, max_gap=None, start=None, stop=None):
+    """
+    Write target measurements with aligned source value as first column to csv.
+
+    Return:
+    int: number of rows written
+    """
+
+    rows = 0
+    with open(path, "w") as f:
+        for timestamps, data, aligned in align(con, session_id, target, source, method, channel, max_gap, start, stop):
+            table = np.column_stack((aligned, data.reshape(len(data), -1)))
+            for ts, row in zip(timestamps.astype(str), table):
+                f.write(ts + "," + ",".join(repr(float(x)) for x in row) + "\n")
+            rows += len(table)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Align a sensor series of a session onto the timestamps of another sensor.")
+    parser.add_argument("--user", default="postgres")
+    parser.add_argument("--password", default=None, help="prompted for if omitted")
+    parser.add_argument("--session", type=int, required=True)
+    parser.add_argument("--target", required=True, help="sensor whose timestamps are used (e.g. Keysight)")
+    parser.add_argument("--source", required=True, help="sensor interpolated onto target timestamps (e.g. PT100_D5)")
+    parser.add_argument("--method", choices=METHODS, default="linear")
+    parser.add_argument("--channel", type=int, default=-1, help="column of source data (default: last)")
+    parser.add_argument("--max-gap", type=float, default=None, help="max seconds between source points")
+    parser.add_argument("--start", help="YYYY-MM-DD_HH-MM-SS (inclusive)")
+    parser.add_argument("--stop", help="YYYY-MM-DD_HH-MM-SS (exclusive)")
+    parser.add_argument("--out", default="aligned.csv")
+    args = parser.parse_args()
+
+    password = args.password
+    if password is None:
+        password = getpass.getpass()
+    saver = Saver.DBSaver()
+    if not saver.connect(args.user, password):
+        parser.exit(1, saver.error + "\n")
+
+    start = Helper.parse_timestamp(args.start) if args.start else None
+    stop = Helper.parse_timestamp(args.stop) if args.stop else None
+    rows = to_csv(saver.con, args.session, args.target, args.source, args.out, args.method, args.channel, args.max_gap, start, stop)
+    print("%d rows written to %s" % (rows, args.out))
+
+if __name__ == "__main__":
+    main()
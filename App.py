@@ -1,5 +1,9 @@
-from Managers import *
-from Controller import *
+import multiprocessing
+from PyQt5.QtWidgets import QApplication, QMainWindow
+from Managers import WidgetManager, SensorManager
+from Controller import Controller
+import Checkpoint
+import Publisher
 
 class MainWindow(QMainWindow):
     """Container for Widgets to be rendered on screen."""
@@ -28,8 +32,26 @@ class MainWindow(QMainWindow):
         # setup model-view-controller
         ctrl.register_view(wman)
         ctrl.register_model(sman)
+        QApplication.instance().aboutToQuit.connect(sman.close)
 
-app = QApplication([])
-window = MainWindow()
-window.show()
-app.exec_()
+        # live stream for dashboards, bind to ("0.0.0.0", Publisher.PORT) for remote subscribers
+        try:
+            ctrl.publisher = Publisher.Publisher()
+        except OSError:
+            wman.message_box("Live stream port %d in use, publishing disabled." % Publisher.PORT)
+
+        # resume session interrupted by power loss
+        state = Checkpoint.load()
+        if state:
+            ctrl.resume(state)
+
+def main():
+    # isolated sensor workers (see Workers.py) start through this entry point in the frozen build
+    multiprocessing.freeze_support()
+    app = QApplication([])
+    window = MainWindow()
+    window.show()
+    app.exec_()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Crash-safe checkpoint of the running measurement session.
+
+The checkpoint is a small json file, written atomically (write to temporary file, fsync, rename),
+so after a power loss it holds either the previous or the new state, never a partial one.
+On boot, Controller.resume() continues the session stored in the checkpoint.
+
+Note: The database password is not stored. Reconnecting uses libpq defaults (~/.pgpass or PGPASSWORD).
+"""
+
+import json
+import os
+import tempfile
+import time
+
+PATH = os.path.join(os.path.expanduser("~"), ".observer", "checkpoint.json")
+VERSION = 1
+
+def save(state, path=PATH):
+    """Write state (json serializable dict) atomically to path."""
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    state = dict(state, version=VERSION)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".checkpoint")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except:
+        os.unlink(tmp)
+        raise
+    # persist rename
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+def load(path=PATH):
+    """
+    Read checkpoint from path.
+
+    Return:
+    dict: state, None if no (valid) checkpoint exists
+    """
+
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(state, dict) or state.get("version") != VERSION:
+        return None
+    return state
+
+def clear(path=PATH):
+    """Remove checkpoint, e.g. when session is stopped regularly."""
+
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+def missed_intervals(state, now=None):
+    """
+    Calculate intervals missed since last measurement of checkpoint state.
+
+    Return:
+    int: number of missed intervals
+    int: miliseconds until next measurement is due (in phase with the original schedule)
+    """
+
+    if now is None:
+        now = time.time()
+    interval = state["interval_ms"] / 1000
+    elapsed = max(now - state["last_measurement"], 0)
+    missed = int(elapsed // interval)
+    remaining = interval - (elapsed % interval)
+    return missed, int(remaining * 1000)
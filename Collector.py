@@ -0,0 +1,391 @@
+"""
+Ingest collector: central write path for several measurement devices.
+
+Devices (Saver.CollectorSaver) push batched, device-tagged measurement frames over TCP.
+The collector assigns session ids (database sequence, collision-free) and writes all frames
+to PostgreSQL through a connection pool (requests wait for a free connection).
+Frames arriving at the same time are written together in one bulk insert and one transaction
+(group commit), a frame is acknowledged once it is committed.
+
+Frame: 4 byte big-endian length, followed by a json message.
+
+Usage:
+python3 Collector.py serve --user postgres --port 5480
+python3 Collector.py loadtest --port 5480 --devices 50 --frames 200
+"""
+
+import argparse
+import getpass
+import json
+import queue
+import socketserver
+import statistics
+import struct
+import threading
+import time
+import numpy as np
+import psycopg2.pool
+from psycopg2.extras import execute_values
+import Helper
+import Migrations
+import Rollup
+
+PORT = 5480
+LENGTH = struct.Struct(">I")
+
+def send_frame(sock, message):
+    """Send json serializable message as frame."""
+
+    payload = json.dumps(message).encode()
+    sock.sendall(LENGTH.pack(len(payload)) + payload)
+
+def recv_exact(sock, n):
+    """Receive exactly n bytes, None on closed connection."""
+
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return bytes(buf)
+
+def recv_frame(sock):
+    """
+    Receive single frame.
+
+    Return:
+    dict: message, None on closed connection
+    """
+
+    header = recv_exact(sock, LENGTH.size)
+    if header is None:
+        return None
+    payload = recv_exact(sock, LENGTH.unpack(header)[0])
+    if payload is None:
+        return None
+    return json.loads(payload)
+
+def to_message(event):
+    """Convert measurement event of Sensor.read() to json serializable dict."""
+
+    event = dict(event)
+    if isinstance(event["data"], np.ndarray):
+        event["data"] = event["data"].tolist()
+    return event
+
+class BlockingPool(psycopg2.pool.ThreadedConnectionPool):
+    """ThreadedConnectionPool that waits for a free connection instead of raising PoolError."""
+
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        self.slots = threading.BoundedSemaphore(maxconn)
+
+    def getconn(self, key=None):
+        self.slots.acquire()
+        try:
+            return super().getconn(key)
+        except:
+            self.slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self.slots.release()
+
+class BulkWriter(threading.Thread):
+    """Write queued measurement frames in bulk through connection pool."""
+
+    def __init__(self, pool, max_batch=500, rollups=True):
+        super().__init__(daemon=True)
+        self.pool = pool
+        self.max_batch = max_batch
+        self.rollups = rollups
+        self.queue = queue.Queue()
+        self.sensor_ids = {}
+        self.lock = threading.Lock()
+
+    def sensor_id(self, cur, name):
+        """Get sensor id of name, add sensor if not exists."""
+
+        with self.lock:
+            if name not in self.sensor_ids:
+                cur.execute("INSERT INTO sensor(name) VALUES(%s) ON CONFLICT (name) DO NOTHING", [name])
+                cur.execute("SELECT id FROM sensor WHERE name=%s", [name])
+                self.sensor_ids[name] = cur.fetchone()[0]
+            return self.sensor_ids[name]
+
+    def submit(self, frame):
+        """
+        Queue frame for writing and wait until it is committed.
+
+        Return:
+        string: error message, None on success
+        """
+
+        item = {"frame": frame, "done": threading.Event(), "error": None}
+        self.queue.put(item)
+        item["done"].wait()
+        return item["error"]
+
+    def run(self):
+        while True:
+            items = [self.queue.get()]
+            # group commit: take everything that queued up during the last write
+            while len(items) < self.max_batch:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.write([item["frame"] for item in items])
+            except Exception:
+                # retry frames one by one, only the bad frame is rejected
+                for item in items:
+                    try:
+                        self.write([item["frame"]])
+                    except Exception as e:
+                        item["error"] = str(e)
+            for item in items:
+                item["done"].set()
+
+    def write(self, frames):
+        """Write measurement and heartbeat rows of frames in a single transaction."""
+
+        con = self.pool.getconn()
+        try:
+            cur = con.cursor()
+            measurements, heartbeats, rollups = [], [], []
+            for frame in frames:
+                session_id = frame["session_id"]
+                for event in frame["events"]:
+                    sensor_id = self.sensor_id(cur, event["id"])
+                    timestamp = Helper.parse_timestamp(event["timestamp"])
+                    measurements.append((sensor_id, timestamp, event["header"], event["data"], event["units"], session_id))
+                    rollups.append((sensor_id, session_id, timestamp, event["data"], event["header"]))
+                for event in frame.get("heartbeats", []):
+                    sensor_id = self.sensor_id(cur, event["id"])
+                    timestamp = Helper.parse_timestamp(event["timestamp"])
+                    heartbeats.append((sensor_id, session_id, timestamp))
+            if measurements:
+                execute_values(cur, "INSERT INTO measurement(sensor_id, timestamp, header, data, units, session_id) VALUES %s", measurements)
+            if heartbeats:
+                execute_values(cur, "INSERT INTO heartbeat(sensor_id, session_id, timestamp) VALUES %s", heartbeats)
+            if self.rollups:
+                Rollup.update(cur, rollups)
+            cur.close()
+            con.commit()
+        except:
+            con.rollback()
+            # cached ids of sensors added in this transaction are void
+            with self.lock:
+                self.sensor_ids.clear()
+            raise
+        finally:
+            self.pool.putconn(con)
+
+class Handler(socketserver.BaseRequestHandler):
+    """Handle connection of a single device."""
+
+    def handle(self):
+        server = self.server
+        while True:
+            try:
+                message = recv_frame(self.request)
+            except (OSError, ValueError):
+                return
+            if message is None:
+                return
+            try:
+                reply = server.dispatch(message)
+            except Exception as e:
+                reply = {"ok": False, "error": str(e)}
+            send_frame(self.request, reply)
+
+class Collector(socketserver.ThreadingTCPServer):
+    """TCP server accepting frames of measurement devices."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, dsn, pool_size=4, max_batch=500):
+        super().__init__(address, Handler)
+        self.pool = BlockingPool(1, pool_size, dsn)
+        con = self.pool.getconn()
+        Migrations.migrate(con)
+        Migrations.ensure_partitions(con)
+        self.pool.putconn(con)
+        self.writer = BulkWriter(self.pool, max_batch)
+        self.writer.start()
+
+    def __execute(self, query, params, fetch=False):
+        """Run single statement on pooled connection."""
+
+        con = self.pool.getconn()
+        try:
+            cur = con.cursor()
+            cur.execute(query, params)
+            ret = cur.fetchone() if fetch else None
+            cur.close()
+            con.commit()
+            return ret
+        except:
+            con.rollback()
+            raise
+        finally:
+            self.pool.putconn(con)
+
+    def dispatch(self, message):
+        """
+        Handle single message of a device.
+
+        Return:
+        dict: reply
+        """
+
+        kind = message["type"]
+        if kind == "hello":
+            for sensor in message["sensors"]:
+                self.__execute("INSERT INTO sensor(name) VALUES(%s) ON CONFLICT (name) DO NOTHING", [sensor])
+            return {"ok": True}
+        elif kind == "session":
+            session_id = self.__execute("INSERT INTO session(timestamp, device) VALUES(now(), %s) RETURNING id", [message["device"]], True)[0]
+            return {"ok": True, "session_id": session_id}
+        elif kind == "resume":
+            exists = self.__execute("SELECT EXISTS(SELECT 1 FROM session WHERE id=%s AND device IS NOT DISTINCT FROM %s)", [message["session_id"], message["device"]], True)[0]
+            return {"ok": exists}
+        elif kind == "measurements":
+            error = self.writer.submit(message)
+            return {"ok": error is None, "error": error}
+        elif kind == "calibration":
+            event = message["event"]
+            self.__execute("INSERT INTO calibration(sensor_id, timestamp, header, data, units) SELECT id, %s, %s, %s, %s FROM sensor WHERE name=%s",
+                           [Helper.parse_timestamp(event["timestamp"]), event["header"], event["data"], event["units"], event["id"]])
+            return {"ok": True}
+        return {"ok": False, "error": "Unknown message type %s" % kind}
+
+def load_test(host, port, devices, frames, events_per_frame=3, points=201):
+    """
+    Push frames of simulated devices concurrently to collector.
+
+    Return:
+    dict: frames (committed), expected frames, seconds, frames_per_s, latency p50/p99 in ms,
+    failed frames (including frames of devices that could not connect), duplicate session ids
+    """
+
+    import Saver
+
+    latencies = []
+    sessions = []
+    failed = []
+    lock = threading.Lock()
+    freq = np.logspace(np.log10(20), np.log10(120E6), points)
+
+    def device(n):
+        rng = np.random.default_rng(n)
+        saver = Saver.CollectorSaver((host, port), "loadtest-%03d" % n)
+        sensors = ["LOAD_%03d_E4990A" % n, "LOAD_%03d_PT100" % n]
+        own, errors = [], 0
+        try:
+            if not saver.connect(None, None):
+                raise ConnectionError("Connection to collector failed")
+            saver.add_sensors(sensors)
+            saver.new_session()
+            send(saver, sensors, rng, own)
+        except Exception as e:
+            print("Device %d: %s" % (n, e))
+            # frames that were not sent count as failed
+            errors += frames - len(own)
+        finally:
+            saver.close()
+        with lock:
+            latencies.extend(t for t in own if t is not None)
+            if saver.session_id is not None:
+                sessions.append(saver.session_id)
+            failed.append(errors + own.count(None))
+
+    def send(saver, sensors, rng, own):
+        """Send frames, append latency (None for rejected frame) to own."""
+
+        for _ in range(frames):
+            events = [{
+                        "id": sensors[0],
+                        "timestamp": Helper.get_timestamp(),
+                        "header": ["Frequenz", "C-Wert", "D-Wert"],
+                        "data": np.column_stack((freq, rng.random(points), rng.random(points))),
+                        "units": ["Hz", "F", "-"]
+                    }]
+            events += [{
+                        "id": sensors[1],
+                        "timestamp": Helper.get_timestamp(),
+                        "header": ["Temperature"],
+                        "data": [20 + rng.random()],
+                        "units": ["*C"]
+                    } for _ in range(events_per_frame - 1)]
+            start = time.perf_counter()
+            try:
+                saver.save_measurement(events)
+                own.append(time.perf_counter() - start)
+            except RuntimeError:
+                own.append(None)
+
+    threads = [threading.Thread(target=device, args=(n,)) for n in range(devices)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+    total = len(latencies)
+    return {
+                "frames": total,
+                "expected": devices * frames,
+                "seconds": seconds,
+                "frames_per_s": total / seconds if seconds else 0.0,
+                "latency_p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+                "latency_p99_ms": latencies[int(0.99 * (total - 1))] * 1000 if latencies else 0.0,
+                "failed": sum(failed),
+                "duplicate_sessions": len(sessions) - len(set(sessions))
+            }
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest collector for several measurement devices.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="run collector")
+    serve.add_argument("--user", default="postgres")
+    serve.add_argument("--password", default=None, help="prompted for if omitted")
+    serve.add_argument("--dbname", default="tacdb")
+    serve.add_argument("--dbhost", default="localhost")
+    serve.add_argument("--bind", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=PORT)
+    serve.add_argument("--pool-size", type=int, default=4)
+    serve.add_argument("--max-batch", type=int, default=500, help="max frames per bulk write")
+    load = sub.add_parser("loadtest", help="push frames of simulated devices to a running collector")
+    load.add_argument("--host", default="localhost")
+    load.add_argument("--port", type=int, default=PORT)
+    load.add_argument("--devices", type=int, default=50)
+    load.add_argument("--frames", type=int, default=200, help="frames per device")
+    load.add_argument("--events", type=int, default=3, help="events per frame")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        password = args.password
+        if password is None:
+            password = getpass.getpass()
+        dsn = "dbname=%s user=%s password=%s host=%s port=5432" % (args.dbname, args.user, password, args.dbhost)
+        server = Collector((args.bind, args.port), dsn, args.pool_size, args.max_batch)
+        print("Collector listening on %s:%d" % (args.bind, args.port))
+        server.serve_forever()
+    else:
+        result = load_test(args.host, args.port, args.devices, args.frames, args.events)
+        for key, value in result.items():
+            print("%s: %s" % (key, value))
+        if result["failed"] or result["duplicate_sessions"] or result["frames"] != result["expected"]:
+            parser.exit(1)
+
+if __name__ == "__main__":
+    main()
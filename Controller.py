@@ -1,9 +1,10 @@
-from Widgets import *
-import psycopg2
-import time
-import Saver
+from PyQt5.QtCore import QTime, QTimer
+from PyQt5.QtWidgets import QMessageBox
+from Widgets import CountTimer
 import Helper
-from numpy import *
+import Filters
+import Checkpoint
+import Publisher
 
 class Controller():
     """
@@ -30,6 +31,19 @@ class Controller():
         self.calibration_cycles = 3
         self.interval_time = QTime(0,0)
         self.saver = None
+        self.change_detector = Filters.ChangeDetector()
+        self.user = None
+        self.missed_intervals = 0
+        self.last_measurement = None
+        # saving failed in last interval, warn only once per outage
+        self.save_failed = False
+        # checkpoint could not be written, warn only once
+        self.checkpoint_failed = False
+        self.checkpoint_path = Checkpoint.PATH
+        # (host, port) of ingest collector, None saves to database directly
+        self.collector = None
+        # live stream of measurement events (see Publisher.py), None disables publishing
+        self.publisher = None
     
     def register_view(self, view):
         """
@@ -52,21 +66,40 @@ class Controller():
         """
 
         self.model = model
+        self.change_detector.deadbands = model.deadbands
         self.interval_timer.timeout.connect(self.measure_all)
 
     def register_saver(self, user, pw):
         """Set reference to Saver. Establish connection to PSQL database."""
 
-        self.saver = Saver.DBSaver()
+        self.saver = self.new_saver()
         if self.saver.connect(user, pw):
+            self.user = user
             self.saver.add_sensors(self.model.sensor_ids)
+            self.load_rtd_coefficients()
             self.view.set_db_con_state(1)
         else:
-            self.view.message_box("Connection failed")
+            self.view.message_box(getattr(self.saver, "error", None) or "Connection failed")
             self.saver = None
             self.view.set_db_con_state(0)
             return
 
+    def load_rtd_coefficients(self):
+        """Pass RTD coefficients from calibration table to sensors (direct database connection only)."""
+
+        if hasattr(self.saver, "con"):
+            import RTD
+            self.model.set_rtd_coefficients(RTD.load_coefficients(self.saver.con))
+
+    def new_saver(self):
+        """Return Saver for configured write path (collector or database)."""
+
+        # imported on first connect, pulls in psycopg2 and numpy
+        import Saver
+        if self.collector:
+            return Saver.CollectorSaver(self.collector)
+        return Saver.DBSaver()
+
     def start(self, time=None):
         """
         Start new measurement session.
@@ -84,16 +117,93 @@ class Controller():
             return
 
         self.saver.new_session()
+        self.change_detector.reset()
+        self.missed_intervals = 0
+        self.last_measurement = Helper.clock()
+        self.write_checkpoint()
 
         self.interval_timer.setInterval(time.msecsSinceStartOfDay())
         self.update_timer.start(self.update_time_ms)
         self.interval_timer.start()
 
+    def resume(self, state):
+        """
+        Resume session from checkpoint state after restart (e.g. power loss).
+
+        Reconnect to database, restore counter and interval and schedule next measurement
+        in phase with the original schedule. Intervals missed while down are added to the counter.
+
+        A checkpoint that can never be resumed (sensor setup changed, session not found) is removed.
+
+        Return:
+        bool: True (session resumed), False (checkpoint not usable)
+        """
+
+        if sorted(state["sensors"]) != sorted(self.model.sensor_ids):
+            self.view.message_box("Could not resume session %s.\nSensor setup changed." % state["session_id"])
+            Checkpoint.clear(self.checkpoint_path)
+            return False
+        self.saver = self.new_saver()
+        if not self.saver.connect(state["user"], None):
+            self.view.message_box("Could not resume session %s.\n%s" % (state["session_id"], getattr(self.saver, "error", None) or "Check database connection."))
+            self.saver = None
+            return False
+        if not self.saver.resume_session(state["session_id"]):
+            self.view.message_box("Could not resume session %s.\nSession not found." % state["session_id"])
+            Checkpoint.clear(self.checkpoint_path)
+            self.saver = None
+            return False
+        self.user = state["user"]
+        self.saver.add_sensors(self.model.sensor_ids)
+        self.load_rtd_coefficients()
+        self.view.set_db_con_state(1)
+
+        missed, remaining = Checkpoint.missed_intervals(state, Helper.clock())
+        self.missed_intervals = state["missed_intervals"] + missed
+        self.last_measurement = state["last_measurement"]
+        self.interval_time = QTime(0,0).addMSecs(state["interval_ms"])
+        self.interval_timer.cnt = state["cnt"] + missed
+        self.write_checkpoint()
+
+        self.view.resume(self.interval_time)
+        # first interval is shortened to the remaining time, restart() sets the regular interval
+        self.interval_timer.setInterval(remaining)
+        self.update_timer.start(self.update_time_ms)
+        self.interval_timer.start()
+        return True
+
+    def write_checkpoint(self, cnt=None):
+        """
+        Store session state to checkpoint file. cnt: number of completed intervals (default counter of interval_timer).
+
+        A failed write (e.g. storage full or read-only) is reported once, measuring continues.
+        """
+
+        try:
+            Checkpoint.save({
+                                "session_id": self.saver.session_id,
+                                "user": self.user,
+                                "cnt": self.interval_timer.cnt if cnt is None else cnt,
+                                "interval_ms": self.interval_time.msecsSinceStartOfDay(),
+                                "sensors": self.model.sensor_ids,
+                                "last_measurement": self.last_measurement,
+                                "missed_intervals": self.missed_intervals
+                            }, self.checkpoint_path)
+        except OSError as e:
+            if not self.checkpoint_failed:
+                self.checkpoint_failed = True
+                # shown after the timer slot returned, a modal box must not block the interval
+                msg = "Could not write checkpoint, session cannot be resumed after power loss.\n%s" % e
+                QTimer.singleShot(0, lambda: self.view.message_box(msg))
+            return
+        self.checkpoint_failed = False
+
     def stop(self):
-        """Stop timers."""
+        """Stop timers. End of session, remove checkpoint."""
 
         self.update_timer.stop()
         self.interval_timer.stop()
+        Checkpoint.clear(self.checkpoint_path)
 
     def pause(self):
         """Deactivate interval_timer during measurement."""
@@ -105,7 +215,7 @@ class Controller():
         """Restart timers."""
 
         self.update_timer.start(self.update_time_ms)
-        self.interval_timer.start()
+        self.interval_timer.start(self.interval_time.msecsSinceStartOfDay())
 
     def measure_all(self):
         """
@@ -118,9 +228,30 @@ class Controller():
 
         self.pause()
         self.view.set_highlight_lbl("Measurement in progress, do not stop.")
-        session_data = self.model.measure_all()
-        self.saver.save_measurement(session_data)
+        session_data = self.model.measure_all(self.interval_timer.cnt)
+        # publish before saving, saver converts data to python lists
+        if self.publisher:
+            for event in session_data:
+                self.publisher.publish(event)
+        # store unchanged measurements as heartbeats only
+        stored, heartbeats = self.change_detector.apply(session_data)
+        error = None
+        try:
+            self.saver.save_measurement(stored, heartbeats)
+        except Exception as e:
+            # keep measuring, next interval is stored in full once saving works again
+            error = e
+            self.change_detector.reset()
+        self.last_measurement = Helper.clock()
+        # CountTimer increments cnt only after this slot returns
+        self.write_checkpoint(self.interval_timer.cnt + 1)
         self.restart()
+        self.view.set_db_con_state(error is None)
+        if error is not None and not self.save_failed:
+            # shown after the timer slot returned, a modal box must not block the interval
+            msg = "Saving measurement failed, measuring continues.\n%s" % error
+            QTimer.singleShot(0, lambda: self.view.message_box(msg))
+        self.save_failed = error is not None
 
     def measure_single(self, index):
         """
@@ -180,6 +311,9 @@ class Controller():
         msg.setDefaultButton(QMessageBox.Yes)
         ret = msg.exec()
         if ret == 0x4000:   # Yes pressed
+            # calibrate with the precise profile, the next interval applies its scheduled profile again
+            if self.model.sweep_schedule is not None:
+                self.model.set_sweep_profile(self.model.sweep_schedule.precise)
             # Get mean on air
             self.view.message_box("Connect to air.")
             air_mean = self.mean(index)
@@ -199,6 +333,8 @@ class Controller():
 
             res["header"]  = ["Frequency", "m", "k"]
             res["units"]   = ["Hz", "", ""]
+            if self.publisher:
+                self.publisher.publish(res, Publisher.CALIBRATION)
             self.saver.save_calibration(res)
         self.view.reset()
 
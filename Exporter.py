@@ -0,0 +1,263 @@
+"""
+Export measurement sessions from the database.
+
+Measurements are streamed through named (server-side) cursors in fixed-size batches,
+so memory use does not depend on the length of a session.
+
+Usage:
+python3 Exporter.py --user postgres --session 3 --sensor PT100_D5 --format npy --out export/
+"""
+
+import argparse
+import csv
+import os
+import getpass
+import numpy as np
+from numpy.lib.format import open_memmap
+import Helper
+import Saver
+
+class SessionExporter():
+    """Stream measurements of a single session out of the database."""
+
+    def __init__(self, con, batch_size=1000, rollback=True):
+        """
+        Store reference to database connection and batch size of server-side cursor.
+
+        rollback: end the transaction of the named cursors after reading. Pass False to read
+        inside a transaction of the caller, which then has to commit or roll back itself.
+        """
+
+        self.con = con
+        self.batch_size = batch_size
+        self.rollback = rollback
+        self._cursor_cnt = 0
+        self._open_cursors = 0
+
+    def __query(self, columns, session_id, sensor, start, stop):
+        """
+        Build query on measurement table for specified filters.
+
+        Return:
+        string: query, [object]: query parameters
+        """
+
+        query = "SELECT %s FROM measurement m JOIN sensor s ON s.id = m.sensor_id WHERE m.session_id = %%s" % columns
+        params = [session_id]
+        if sensor is not None:
+            query += " AND s.name = %s"
+            params.append(sensor)
+        if start is not None:
+            query += " AND m.timestamp >= %s"
+            params.append(start)
+        if stop is not None:
+            query += " AND m.timestamp < %s"
+            params.append(stop)
+        return query, params
+
+    def count(self, session_id, sensor=None, start=None, stop=None):
+        """Return number of measurements matching the filters."""
+
+        query, params = self.__query("COUNT(*)", session_id, sensor, start, stop)
+        cur = self.con.cursor()
+        cur.execute(query, params)
+        ret = cur.fetchone()[0]
+        cur.close()
+        return ret
+
+    def sensors(self, session_id):
+        """Return names of all sensors with measurements in session."""
+
+        cur = self.con.cursor()
+        cur.execute("SELECT DISTINCT s.name FROM measurement m JOIN sensor s ON s.id = m.sensor_id WHERE m.session_id = %s ORDER BY s.name", [session_id])
+        ret = [row[0] for row in cur.fetchall()]
+        cur.close()
+        return ret
+
+    def iter_rows(self, session_id, sensor=None, start=None, stop=None):
+        """
+        Generator over measurements of session in chronological order.
+
+        Rows are fetched batch_size at a time through a named cursor,
+        only one batch is held in memory at any time.
+
+        Yield:
+        (sensor_name, timestamp, header, data, units)
+        """
+
+        query, params = self.__query("s.name, m.timestamp, m.header, m.data, m.units", session_id, sensor, start, stop)
+        query += " ORDER BY m.timestamp, m.id"
+
+        self._cursor_cnt += 1
+        cur = self.con.cursor(name="export_%d_%d" % (os.getpid(), self._cursor_cnt))
+        cur.itersize = self.batch_size
+        self._open_cursors += 1
+        try:
+            cur.execute(query, params)
+            while True:
+                rows = cur.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            cur.close()
+            # named cursors live inside a transaction, end it once no other generator reads
+            self._open_cursors -= 1
+            if not self._open_cursors and self.rollback:
+                self.con.rollback()
+
+    def iter_batches(self, session_id, sensor, start=None, stop=None):
+        """
+        Generator over measurements of a single sensor as numpy batches.
+
+        All measurements of a batch have the same shape, a batch ends early if the shape changes.
+
+        Yield:
+        np_array[n] of datetime64[s] timestamps, np_array[n][...] data
+        """
+
+        timestamps, data = [], []
+        shape = None
+        for _, timestamp, _, values, _ in self.iter_rows(session_id, sensor, start, stop):
+            values = np.array(values, dtype=np.float64)
+            # shape changes with sweep profile, start a new batch
+            if data and values.shape != shape:
+                yield np.array(timestamps, dtype="datetime64[s]"), np.array(data, dtype=np.float64)
+                timestamps, data = [], []
+            shape = values.shape
+            timestamps.append(to_datetime64(timestamp))
+            data.append(values)
+            if len(data) == self.batch_size:
+                yield np.array(timestamps, dtype="datetime64[s]"), np.array(data, dtype=np.float64)
+                timestamps, data = [], []
+        if data:
+            yield np.array(timestamps, dtype="datetime64[s]"), np.array(data, dtype=np.float64)
+
+    def to_npy(self, session_id, sensor, path, start=None, stop=None):
+        """
+        Write measurements of a single sensor to .npy files.
+
+        Data is written to <path>.npy with shape [measurements][...],
+        timestamps to <path>_timestamps.npy. Both files are written through memory maps.
+        Counting and reading run in one REPEATABLE READ transaction, so the files are sized
+        to exactly the exported rows. (With rollback=False the transaction of the caller is used.)
+
+        Return:
+        int: number of exported measurements
+        """
+
+        if self.rollback:
+            # start a new transaction, count and rows come from the same snapshot
+            self.con.rollback()
+            cur = self.con.cursor()
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            cur.close()
+        n = self.count(session_id, sensor, start, stop)
+        if n == 0:
+            if self.rollback:
+                self.con.rollback()
+            return 0
+
+        data = None
+        timestamps = open_memmap(path + "_timestamps.npy", mode="w+", dtype="datetime64[s]", shape=(n,))
+        i = 0
+        for ts, values in self.iter_batches(session_id, sensor, start, stop):
+            if data is None:
+                data = open_memmap(path + ".npy", mode="w+", dtype=np.float64, shape=(n,) + values.shape[1:])
+            elif values.shape[1:] != data.shape[1:]:
+                raise ValueError("Shape of %s measurements changes within session, export as csv." % sensor)
+            data[i:i+len(values)] = values
+            timestamps[i:i+len(values)] = ts
+            i += len(values)
+            data.flush()
+            timestamps.flush()
+        del data, timestamps
+        return i
+
+    def to_csv(self, session_id, sensor, path, start=None, stop=None):
+        """
+        Write measurements of a single sensor to csv archive.
+
+        One line per row of measurement data, prefixed by the measurement timestamp.
+
+        Return:
+        int: number of exported measurements
+        """
+
+        n = 0
+        with open(path + ".csv", "w", newline="") as f:
+            writer = csv.writer(f)
+            for _, timestamp, header, values, units in self.iter_rows(session_id, sensor, start, stop):
+                if n == 0:
+                    writer.writerow(["Timestamp"] + ["%s [%s]" % (h, u) for h, u in zip(header, units)])
+                timestamp = str(to_datetime64(timestamp))
+                # scalar sensors store a flat list, sweeps a list of rows
+                rows = values if values and isinstance(values[0], list) else [values]
+                for row in rows:
+                    writer.writerow([timestamp] + row)
+                n += 1
+        return n
+
+    def export(self, session_id, out_dir, sensors=None, fmt="npy", start=None, stop=None):
+        """
+        Export measurements of session to out_dir, one file (set) per sensor.
+
+        Return:
+        dict: number of exported measurements per sensor
+        """
+
+        os.makedirs(out_dir, exist_ok=True)
+        if not sensors:
+            sensors = self.sensors(session_id)
+        ret = {}
+        for sensor in sensors:
+            path = os.path.join(out_dir, "session_%s_%s" % (session_id, sensor))
+            if fmt == "npy":
+                ret[sensor] = self.to_npy(session_id, sensor, path, start, stop)
+            else:
+                ret[sensor] = self.to_csv(session_id, sensor, path, start, stop)
+        return ret
+
+def to_datetime64(timestamp):
+    """
+    Convert timestamp to np.datetime64 in local time.
+
+    Accepts datetime (timestamptz column) or string in format YYYY-MM-DD_HH-MM-SS (legacy text column).
+    """
+
+    if isinstance(timestamp, str):
+        timestamp = Helper.parse_timestamp(timestamp)
+    elif timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    return np.datetime64(timestamp, "s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a measurement session from the database.")
+    parser.add_argument("--user", default="postgres")
+    parser.add_argument("--password", default=None, help="prompted for if omitted")
+    parser.add_argument("--session", type=int, required=True)
+    parser.add_argument("--sensor", action="append", help="sensor name, may be repeated (default: all)")
+    parser.add_argument("--start", help="YYYY-MM-DD_HH-MM-SS (inclusive)")
+    parser.add_argument("--stop", help="YYYY-MM-DD_HH-MM-SS (exclusive)")
+    parser.add_argument("--format", choices=["npy", "csv"], default="npy")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--out", default=".")
+    args = parser.parse_args()
+
+    password = args.password
+    if password is None:
+        password = getpass.getpass()
+    saver = Saver.DBSaver()
+    if not saver.connect(args.user, password):
+        parser.exit(1, saver.error + "\n")
+
+    start = Helper.parse_timestamp(args.start) if args.start else None
+    stop = Helper.parse_timestamp(args.stop) if args.stop else None
+    exporter = SessionExporter(saver.con, args.batch_size)
+    counts = exporter.export(args.session, args.out, args.sensor, args.format, start, stop)
+    for sensor, n in counts.items():
+        print("%s: %d measurements" % (sensor, n))
+
+if __name__ == "__main__":
+    main()
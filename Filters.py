@@ -0,0 +1,84 @@
+"""Filters applied to measurement data between SensorManager and Saver."""
+
+import Helper
+
+class Deadband():
+    """
+    Change detection settings of a single sensor.
+
+    A measurement counts as changed if any value differs from the last stored measurement
+    by more than abs + rel * |last value|. Unchanged measurements are stored anyway
+    once max_gap seconds have passed since the last stored measurement.
+    """
+
+    def __init__(self, rel=0.0, abs=0.0, max_gap=3600):
+        self.rel = rel
+        self.abs = abs
+        self.max_gap = max_gap
+
+    def changed(self, last, new):
+        """
+        Compare two measurement data arrays.
+
+        Return:
+        bool: True if new differs from last by more than the deadband
+        """
+
+        import numpy as np
+        last = np.asarray(last, dtype=np.float64)
+        new = np.asarray(new, dtype=np.float64)
+        if last.shape != new.shape:
+            return True
+        # NaN never equals NaN, treat matching NaNs as unchanged
+        return not np.all(np.isclose(new, last, rtol=self.rel, atol=self.abs, equal_nan=True))
+
+class ChangeDetector():
+    """
+    Split measurements into changed ones (to be stored in full) and heartbeats.
+
+    Sensors without Deadband in deadbands are always stored in full.
+    Measurements are compared with the last stored one of the same shape, so sensors
+    alternating sweep profiles (see Sensors.SweepSchedule) are compared per profile
+    and max_gap applies to every profile separately.
+    """
+
+    def __init__(self, deadbands=None):
+        self.deadbands = deadbands if deadbands is not None else {}
+        self.last = {}
+
+    def reset(self):
+        """Forget last stored measurements, e.g. at start of a new session."""
+
+        self.last = {}
+
+    def apply(self, session_data):
+        """
+        Apply change detection to measurement data of all sensors.
+
+        Return:
+        [dict]: events to store in full
+        [dict]: events to store as heartbeat only
+        """
+
+        import numpy as np
+        stored = []
+        heartbeats = []
+        for event in session_data:
+            deadband = self.deadbands.get(event["id"])
+            if deadband is None:
+                stored.append(event)
+                continue
+
+            timestamp = Helper.parse_timestamp(event["timestamp"])
+            data = np.array(event["data"], dtype=np.float64)
+            key = (event["id"], data.shape)
+            last = self.last.get(key)
+            if last is None \
+                    or (timestamp - last[0]).total_seconds() >= deadband.max_gap \
+                    or deadband.changed(last[1], data):
+                # keep a copy, event data may be altered by saver
+                self.last[key] = (timestamp, data)
+                stored.append(event)
+            else:
+                heartbeats.append(event)
+        return stored, heartbeats
@@ -1,7 +1,12 @@
-from Widgets import *
-from Sensors import *
-import sys
-import os
+from PyQt5.QtCore import QTime
+from PyQt5.QtWidgets import QApplication, QGroupBox, QHBoxLayout, QLabel, QLineEdit, QMessageBox, QTableWidgetItem, \
+                            QVBoxLayout, QWidget
+from Widgets import Button, Label, RepeatButton, Table, TimeDisplay, ToggleButton
+from Sensors import KeysightE4990A, PT100
+# used by the configuration examples in SensorManager.create_sensors
+from Sensors import SweepSchedule  # noqa: F401
+from Filters import Deadband  # noqa: F401
+import Workers
 
 class WidgetManager:
     """MVC-View Class: Layout and Management of Widgets on Screen."""
@@ -182,6 +187,14 @@ class WidgetManager:
         else:
             self.widgets["icon"].setText("disconnected.")
 
+    def resume(self, time):
+        """Set Widgets to running state of a resumed session with interval time."""
+
+        self.widgets["te"].interval = time
+        self.widgets["te"].reset()
+        self.activate_widgets(False)
+        self.widgets["sbtn"].set()
+
     def reset(self):
         """Reset altered Widgets to initial values."""
 
@@ -203,6 +216,12 @@ class SensorManager():
 
     def __init__(self):
         self.sensors = {}
+        # change detection settings per sensor id (see Filters.Deadband)
+        self.deadbands = {}
+        # sweep profile per measurement cycle (see Sensors.SweepSchedule), None keeps current profile
+        self.sweep_schedule = None
+        # run every sensor driver in its own worker process (see Workers.py)
+        self.isolated = False
 
     @property
     def sensor_ids(self):
@@ -225,27 +244,115 @@ class SensorManager():
         [int]: list of int (0 or 1) to show if sensor is calibratable
         """
 
-        ia = KeysightE4990A([2391, 6153])
-        rtd1 = PT100("D5")
-        rtd2 = PT100("D6")
+        ia = self.create(KeysightE4990A, [2391, 6153])
+        # raw capture for high sample rates: self.create(PT100, "D5", True, 10) (see RTD.py)
+        rtd1 = self.create(PT100, "D5")
+        rtd2 = self.create(PT100, "D6")
         self.sensors = {
                             "Keysight": ia,
                             "PT100_1": rtd1,
                             "PT100_2": rtd2
                        }
+        # e.g. store a measurement in full only if it changed or after max_gap seconds (see Filters.Deadband):
+        # self.deadbands = {
+        #                     ia.property["id"]: Deadband(rel=1e-3, max_gap=3600),
+        #                     rtd1.property["id"]: Deadband(abs=0.05, max_gap=3600),
+        #                     rtd2.property["id"]: Deadband(abs=0.05, max_gap=3600)
+        #                  }
+        # e.g. fast monitoring sweeps with a precise sweep every 10th interval:
+        # self.sweep_schedule = SweepSchedule(base="monitor", precise="precise", every=10)
         calibratable = [sensor.property["calibratable"] for sensor in self.sensors.values()]
         return [*self.sensors], calibratable
     
+    def create(self, factory, *args):
+        """Instantiate sensor factory(*args), in a supervised worker process if self.isolated."""
+
+        if self.isolated:
+            return Workers.IsolatedSensor(factory, *args)
+        return factory(*args)
+
     def measure_single(self, index):
         """Return measurement data of single sensor."""
 
         sensor = list(self.sensors.values())[index]
-        return sensor.read()
+        event = sensor.read()
+        if self.isolated:
+            # calibration keeps several readings, detach data from ring buffer
+            event["data"] = event["data"].copy()
+        return event
         
-    def measure_all(self):
-        """Return measurement data of all sensors in self.sensors."""
+    def set_rtd_coefficients(self, coefficients):
+        """Pass Callendar-Van Dusen coefficients {sensor_id: (R0, A, B, C)} to RTD sensors (used in raw mode)."""
 
-        data = []
         for sensor in self.sensors.values():
-            data.append(sensor.read())
+            if hasattr(sensor, "set_coefficients"):
+                sensor.set_coefficients(coefficients.get(sensor.property["id"]))
+
+    def set_sweep_profile(self, name):
+        """
+        Apply sweep profile name to all sensors supporting sweep profiles.
+
+        Return:
+        [object]: isolated sensors whose worker failed (profile not applied)
+        """
+
+        failed = []
+        for sensor in self.sensors.values():
+            if hasattr(sensor, "apply_profile"):
+                try:
+                    sensor.apply_profile(name)
+                except Workers.WorkerError:
+                    if not self.isolated:
+                        raise
+                    failed.append(sensor)
+        return failed
+
+    def sweep_times(self):
+        """
+        Return last measured sweep times of all sensors supporting sweep profiles.
+
+        Return:
+        dict: {sensor_id: {profile: seconds}}
+        """
+
+        return {sensor.property["id"]: dict(sensor.sweep_times) for sensor in self.sensors.values() if hasattr(sensor, "sweep_times")}
+
+    def measure_all(self, cycle=None):
+        """
+        Return measurement data of all sensors in self.sensors.
+
+        cycle: number of measurement interval, selects sweep profile if sweep_schedule is set.
+        """
+
+        failed = []
+        if self.sweep_schedule is not None and cycle is not None:
+            failed = self.set_sweep_profile(self.sweep_schedule.profile(cycle))
+        if not self.isolated:
+            return [sensor.read() for sensor in self.sensors.values()]
+
+        # start all workers first, so the sensors are read in parallel
+        started = []
+        for sensor in self.sensors.values():
+            if sensor in failed:
+                # worker failed while applying the profile, skip instead of measuring with the wrong one
+                continue
+            try:
+                sensor.start_read()
+                started.append(sensor)
+            except Workers.WorkerError:
+                # only the failed driver misses this interval, its worker restarts on next read
+                pass
+        data = []
+        for sensor in started:
+            try:
+                data.append(sensor.finish_read())
+            except Workers.WorkerError:
+                pass
         return data
+
+    def close(self):
+        """Stop worker processes of isolated sensors."""
+
+        for sensor in self.sensors.values():
+            if isinstance(sensor, Workers.IsolatedSensor):
+                sensor.close()
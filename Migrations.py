@@ -0,0 +1,281 @@
+"""
+Versioned schema migrations for the measurement database.
+
+Each migration is applied once, in order, and recorded in table schema_version.
+Partitioning of the measurement table by time range is optional (see partition_measurement).
+
+Usage:
+python3 Migrations.py --user postgres              (apply pending migrations)
+python3 Migrations.py --user postgres --status     (show applied migrations)
+python3 Migrations.py --user postgres --partition  (partition measurement table by month)
+"""
+
+import argparse
+import datetime
+import getpass
+import Saver
+
+# arbitrary key for pg_advisory_xact_lock, serializes concurrent migration runs
+LOCK_KEY = 4990
+
+"""List of migrations: (version, description, [statements])."""
+MIGRATIONS = [
+    (1, "Baseline schema", [
+        """CREATE TABLE IF NOT EXISTS sensor (
+                id serial PRIMARY KEY,
+                name text NOT NULL
+            )""",
+        """CREATE TABLE IF NOT EXISTS session (
+                id serial PRIMARY KEY,
+                timestamp text NOT NULL
+            )""",
+        """CREATE TABLE IF NOT EXISTS measurement (
+                id bigserial PRIMARY KEY,
+                sensor_id integer NOT NULL REFERENCES sensor(id),
+                timestamp text NOT NULL,
+                header text[],
+                data double precision[],
+                units text[],
+                session_id integer NOT NULL REFERENCES session(id)
+            )""",
+        """CREATE TABLE IF NOT EXISTS calibration (
+                id serial PRIMARY KEY,
+                sensor_id integer NOT NULL REFERENCES sensor(id),
+                timestamp text NOT NULL,
+                header text[],
+                data double precision[],
+                units text[]
+            )""",
+    ]),
+    (2, "Store timestamps as timestamptz", [
+        # legacy timestamps are formatted as YYYY-MM-DD_HH-MM-SS in local time (see Helper.get_timestamp)
+        "ALTER TABLE %s ALTER COLUMN timestamp TYPE timestamptz USING to_timestamp(timestamp::text, 'YYYY-MM-DD_HH24-MI-SS')" % table
+        for table in ("session", "measurement", "calibration")
+    ] + [
+        "ALTER TABLE session ALTER COLUMN timestamp SET DEFAULT now()",
+    ]),
+    (3, "Unique sensor names and indexes for per-session queries", [
+        # merge duplicate sensor rows created by concurrent add_sensors calls
+        """UPDATE measurement m SET sensor_id = d.keep FROM (
+                SELECT id, MIN(id) OVER (PARTITION BY name) AS keep FROM sensor
+            ) d WHERE m.sensor_id = d.id AND d.id <> d.keep""",
+        """UPDATE calibration c SET sensor_id = d.keep FROM (
+                SELECT id, MIN(id) OVER (PARTITION BY name) AS keep FROM sensor
+            ) d WHERE c.sensor_id = d.id AND d.id <> d.keep""",
+        "DELETE FROM sensor s USING sensor t WHERE s.name = t.name AND s.id > t.id",
+        "CREATE UNIQUE INDEX IF NOT EXISTS sensor_name_key ON sensor (name)",
+        "CREATE INDEX IF NOT EXISTS measurement_session_sensor_timestamp_idx ON measurement (session_id, sensor_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS calibration_sensor_timestamp_idx ON calibration (sensor_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS session_timestamp_idx ON session (timestamp)",
+    ]),
+    (4, "Rollup table per minute and hour", [
+        """CREATE TABLE IF NOT EXISTS rollup (
+                resolution text NOT NULL,
+                sensor_id integer NOT NULL REFERENCES sensor(id),
+                session_id integer NOT NULL REFERENCES session(id),
+                bucket timestamptz NOT NULL,
+                channel smallint NOT NULL,
+                frequency double precision NOT NULL,
+                mean double precision NOT NULL,
+                min double precision NOT NULL,
+                max double precision NOT NULL,
+                sum double precision NOT NULL,
+                count integer NOT NULL,
+                PRIMARY KEY (resolution, session_id, sensor_id, bucket, channel, frequency)
+            )""",
+    ]),
+    (5, "Heartbeats of measurements skipped by change detection", [
+        """CREATE TABLE IF NOT EXISTS heartbeat (
+                id bigserial PRIMARY KEY,
+                sensor_id integer NOT NULL REFERENCES sensor(id),
+                session_id integer NOT NULL REFERENCES session(id),
+                timestamp timestamptz NOT NULL
+            )""",
+        "CREATE INDEX IF NOT EXISTS heartbeat_session_sensor_timestamp_idx ON heartbeat (session_id, sensor_id, timestamp)",
+    ]),
+    (6, "Device tag of sessions", [
+        "ALTER TABLE session ADD COLUMN IF NOT EXISTS device text",
+    ]),
+]
+
+def current_version(con):
+    """
+    Get latest applied migration version.
+
+    Return:
+    int: version (0 if no migration applied)
+    """
+
+    cur = con.cursor()
+    cur.execute("""CREATE TABLE IF NOT EXISTS schema_version (
+                        version integer PRIMARY KEY,
+                        description text NOT NULL,
+                        applied_at timestamptz NOT NULL DEFAULT now()
+                    )""")
+    cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    ret = cur.fetchone()[0]
+    cur.close()
+    con.commit()
+    return ret
+
+def migrate(con, target=None):
+    """
+    Apply all pending migrations up to target version (default: latest).
+
+    Every migration runs in its own transaction.
+
+    Return:
+    [int]: list of applied versions
+    """
+
+    applied = []
+    current_version(con)
+    for version, description, statements in MIGRATIONS:
+        if target is not None and version > target:
+            break
+        cur = con.cursor()
+        try:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", [LOCK_KEY])
+            cur.execute("SELECT EXISTS(SELECT 1 FROM schema_version WHERE version=%s)", [version])
+            if cur.fetchone()[0]:
+                con.rollback()
+                continue
+            for statement in statements:
+                cur.execute(statement)
+            cur.execute("INSERT INTO schema_version(version, description) VALUES(%s,%s)", [version, description])
+            con.commit()
+        except:
+            con.rollback()
+            raise
+        finally:
+            cur.close()
+        applied.append(version)
+    return applied
+
+def is_partitioned(con, table="measurement"):
+    """Return True if table is partitioned."""
+
+    cur = con.cursor()
+    cur.execute("SELECT EXISTS(SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))", [table])
+    ret = cur.fetchone()[0]
+    cur.close()
+    return ret
+
+def month_start(date, offset=0):
+    """Return first day of month of date, shifted by offset months."""
+
+    month = date.year * 12 + date.month - 1 + offset
+    return datetime.date(month // 12, month % 12 + 1, 1)
+
+def ensure_partitions(con, months_ahead=3):
+    """
+    Create monthly partitions of measurement table up to months_ahead months from now.
+
+    Does nothing if measurement table is not partitioned.
+    Note: Rows that landed in the default partition block creation of the overlapping partition,
+    such months are skipped and stay in the default partition.
+    """
+
+    if not is_partitioned(con):
+        return
+    cur = con.cursor()
+    today = datetime.date.today()
+    for offset in range(months_ahead + 1):
+        start = month_start(today, offset)
+        _create_partition(cur, start)
+    cur.close()
+    con.commit()
+
+def _create_partition(cur, start):
+    """Create partition of measurement table for month beginning at start if not exists."""
+
+    name = "measurement_%04d%02d" % (start.year, start.month)
+    stop = month_start(start, 1)
+    cur.execute("SAVEPOINT create_partition")
+    try:
+        cur.execute("CREATE TABLE IF NOT EXISTS %s PARTITION OF measurement FOR VALUES FROM (%%s) TO (%%s)" % name, [start, stop])
+        cur.execute("RELEASE SAVEPOINT create_partition")
+    except Exception:
+        cur.execute("ROLLBACK TO SAVEPOINT create_partition")
+
+def partition_measurement(con, months_ahead=3):
+    """
+    Convert measurement table into table partitioned by month on timestamp.
+
+    Existing rows are copied into the new partitions in a single transaction,
+    which takes a while on large tables. Rows outside of all partitions go to measurement_default.
+    """
+
+    if current_version(con) < 3:
+        raise RuntimeError("Apply migrations before partitioning.")
+    if is_partitioned(con):
+        return
+
+    cur = con.cursor()
+    try:
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", [LOCK_KEY])
+        cur.execute("ALTER TABLE measurement RENAME TO measurement_unpartitioned")
+        cur.execute("ALTER TABLE measurement_unpartitioned RENAME CONSTRAINT measurement_pkey TO measurement_unpartitioned_pkey")
+        cur.execute("ALTER INDEX measurement_session_sensor_timestamp_idx RENAME TO measurement_unpartitioned_idx")
+        cur.execute("""CREATE TABLE measurement (
+                            LIKE measurement_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+                            PRIMARY KEY (id, timestamp),
+                            FOREIGN KEY (sensor_id) REFERENCES sensor(id),
+                            FOREIGN KEY (session_id) REFERENCES session(id)
+                        ) PARTITION BY RANGE (timestamp)""")
+        # keep id sequence alive when old table is dropped
+        cur.execute("SELECT pg_get_serial_sequence('measurement_unpartitioned', 'id')")
+        sequence = cur.fetchone()[0]
+        if sequence:
+            cur.execute("ALTER SEQUENCE %s OWNED BY measurement.id" % sequence)
+        cur.execute("CREATE INDEX measurement_session_sensor_timestamp_idx ON measurement (session_id, sensor_id, timestamp)")
+
+        cur.execute("SELECT MIN(timestamp) FROM measurement_unpartitioned")
+        first = cur.fetchone()[0]
+        start = month_start(first.date() if first else datetime.date.today())
+        stop = month_start(datetime.date.today(), months_ahead)
+        while start <= stop:
+            _create_partition(cur, start)
+            start = month_start(start, 1)
+        cur.execute("CREATE TABLE measurement_default PARTITION OF measurement DEFAULT")
+
+        cur.execute("INSERT INTO measurement SELECT * FROM measurement_unpartitioned")
+        cur.execute("DROP TABLE measurement_unpartitioned")
+        con.commit()
+    except:
+        con.rollback()
+        raise
+    finally:
+        cur.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply schema migrations to the measurement database.")
+    parser.add_argument("--user", default="postgres")
+    parser.add_argument("--password", default=None, help="prompted for if omitted")
+    parser.add_argument("--target", type=int, default=None, help="migrate up to this version")
+    parser.add_argument("--status", action="store_true", help="only show applied migrations")
+    parser.add_argument("--partition", action="store_true", help="partition measurement table by month")
+    parser.add_argument("--months-ahead", type=int, default=3)
+    args = parser.parse_args()
+
+    password = args.password
+    if password is None:
+        password = getpass.getpass()
+    saver = Saver.DBSaver()
+    if not saver.connect(args.user, password, check_schema=False):
+        parser.exit(1, "Connection failed\n")
+    con = saver.con
+
+    if not args.status:
+        for version in migrate(con, args.target):
+            print("Applied migration %d" % version)
+        if args.partition:
+            partition_measurement(con, args.months_ahead)
+            print("Partitioned measurement table")
+
+    print("Schema version %d (latest %d)" % (current_version(con), MIGRATIONS[-1][0]))
+    if is_partitioned(con):
+        print("measurement is partitioned")
+
+if __name__ == "__main__":
+    main()
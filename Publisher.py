@@ -0,0 +1,231 @@
+"""
+Live publish/subscribe stream of measurement events.
+
+The Publisher broadcasts every measurement (and calibration) event to connected subscribers.
+Each subscriber has a bounded queue; a subscriber that falls behind is dropped,
+publishing never blocks the measurement.
+
+Frame: header (magic, kind, meta length, payload length), json meta
+(id, timestamp, header, units, dtype, shape), raw numpy buffer of data.
+A subscriber opens the stream with a SUBSCRIBE frame, meta {"sensors": [ids]} (empty: all sensors).
+
+Usage:
+for kind, event in Subscriber(("localhost", 5490), ["PT100_D5"]):
+    print(event["timestamp"], event["data"])
+"""
+
+import json
+import queue
+import socket
+import struct
+import threading
+
+PORT = 5490
+MAGIC = b"OBS1"
+HEADER = struct.Struct(">4sBII")
+
+MEASUREMENT = 0
+CALIBRATION = 1
+SUBSCRIBE = 2
+
+def encode(kind, event):
+    """
+    Encode event of Sensor.read() as frame.
+
+    Return:
+    bytes: frame
+    """
+
+    import numpy as np
+    data = np.ascontiguousarray(event["data"], dtype=np.float64)
+    meta = json.dumps({
+                        "id": event["id"],
+                        "timestamp": event["timestamp"],
+                        "header": event["header"],
+                        "units": event["units"],
+                        "dtype": data.dtype.str,
+                        "shape": data.shape
+                    }).encode()
+    return b"".join((HEADER.pack(MAGIC, kind, len(meta), data.nbytes), meta, data.data))
+
+def recv_exact(sock, n):
+    """Receive exactly n bytes, None on closed connection."""
+
+    buf = bytearray(n)
+    view = memoryview(buf)
+    while n:
+        k = sock.recv_into(view, n)
+        if not k:
+            return None
+        view = view[k:]
+        n -= k
+    return buf
+
+def decode(sock):
+    """
+    Receive and decode single frame.
+
+    Return:
+    int: kind, dict: event (data as np_array), None on closed connection
+    """
+
+    header = recv_exact(sock, HEADER.size)
+    if header is None:
+        return None
+    magic, kind, meta_len, payload_len = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError("Invalid frame")
+    meta = recv_exact(sock, meta_len)
+    payload = recv_exact(sock, payload_len)
+    if meta is None or payload is None:
+        return None
+    event = json.loads(meta)
+    if "dtype" in event:
+        import numpy as np
+        event["data"] = np.frombuffer(payload, dtype=event.pop("dtype")).reshape(event.pop("shape"))
+    return kind, event
+
+class Subscription():
+    """Connection to a single subscriber with bounded send queue."""
+
+    def __init__(self, sock, queue_size):
+        self.sock = sock
+        # set by SUBSCRIBE frame, no events are queued before
+        self.sensors = None
+        self.queue = queue.Queue(queue_size)
+        self.closed = False
+        self.thread = threading.Thread(target=self.__send, daemon=True)
+        self.thread.start()
+
+    def wants(self, sensor_id):
+        """Return True if subscriber wants events of sensor_id."""
+
+        sensors = self.sensors
+        return sensors is not None and (not sensors or sensor_id in sensors)
+
+    def offer(self, frame):
+        """
+        Queue frame for sending without blocking.
+
+        Return:
+        bool: False if queue is full (subscriber too slow)
+        """
+
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except queue.Full:
+            return False
+
+    def close(self):
+        self.closed = True
+        # wake up sender thread
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    def __subscribe(self):
+        """
+        Receive SUBSCRIBE frame of subscriber.
+
+        Return:
+        bool: False if handshake failed
+        """
+
+        try:
+            frame = decode(self.sock)
+        except (OSError, ValueError):
+            return False
+        if frame is None or frame[0] != SUBSCRIBE:
+            return False
+        self.sensors = set(frame[1].get("sensors", []))
+        return True
+
+    def __send(self):
+        # handshake in this thread, a silent client does not block accepting others
+        if not self.__subscribe():
+            self.close()
+            return
+        while not self.closed:
+            frame = self.queue.get()
+            if frame is None:
+                break
+            try:
+                self.sock.sendall(frame)
+            except OSError:
+                self.closed = True
+
+class Publisher():
+    """Broadcast measurement events to subscribers over TCP."""
+
+    def __init__(self, address=("127.0.0.1", PORT), queue_size=64, send_timeout=5):
+        """Start listening on address. Subscribers with more than queue_size pending frames are dropped."""
+
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.subscriptions = []
+        self.lock = threading.Lock()
+        self.server = socket.create_server(address)
+        self.address = self.server.getsockname()
+        threading.Thread(target=self.__accept, daemon=True).start()
+
+    def __accept(self):
+        while True:
+            try:
+                sock, _ = self.server.accept()
+            except OSError:
+                return
+            try:
+                sock.settimeout(self.send_timeout)
+            except OSError:
+                sock.close()
+                continue
+            subscription = Subscription(sock, self.queue_size)
+            with self.lock:
+                self.subscriptions.append(subscription)
+
+    def publish(self, event, kind=MEASUREMENT):
+        """Send event to all subscribers of its sensor. Drop subscribers that cannot keep up."""
+
+        with self.lock:
+            subscriptions = [s for s in self.subscriptions if not s.closed and s.wants(event["id"])]
+            self.subscriptions = [s for s in self.subscriptions if not s.closed]
+        if not subscriptions:
+            return
+        frame = encode(kind, event)
+        for subscription in subscriptions:
+            if not subscription.offer(frame):
+                subscription.close()
+
+    def close(self):
+        """Stop listening and disconnect all subscribers."""
+
+        self.server.close()
+        with self.lock:
+            for subscription in self.subscriptions:
+                subscription.close()
+            self.subscriptions = []
+
+class Subscriber():
+    """Iterate over events of a Publisher: yields (kind, event)."""
+
+    def __init__(self, address=("localhost", PORT), sensors=None):
+        self.sock = socket.create_connection(address)
+        meta = json.dumps({"sensors": list(sensors or [])}).encode()
+        self.sock.sendall(HEADER.pack(MAGIC, SUBSCRIBE, len(meta), 0) + meta)
+
+    def __iter__(self):
+        while True:
+            frame = decode(self.sock)
+            if frame is None:
+                return
+            yield frame
+
+    def close(self):
+        self.sock.close()
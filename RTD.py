@@ -0,0 +1,90 @@
+"""
+Vectorized conversion of raw PT100 readings (MAX31865 ADC codes) to temperature.
+
+Conversion follows the Callendar-Van Dusen equation
+    R(T) = R0 * (1 + A*T + B*T^2 + C*(T - 100)*T^3)    (C = 0 for T >= 0)
+on whole numpy arrays. Coefficients per sensor are stored in the calibration table
+with header ["R0", "A", "B", "C"], so stored raw data can be reprocessed with corrected coefficients.
+"""
+
+import numpy as np
+import Exporter
+
+"""Coefficients of IEC 60751 (R0, A, B, C)."""
+IEC_60751 = (100.0, 3.9083E-3, -5.775E-7, -4.183E-12)
+
+HEADER = ["R0", "A", "B", "C"]
+RAW_HEADER = ["RTD code", "Fault", "Temperature"]
+
+def resistance(codes, ref_resistor=430.0):
+    """Convert 15 bit ADC codes of MAX31865 to resistance in Ohm."""
+
+    return np.asarray(codes, dtype=np.float64) / 32768 * ref_resistor
+
+def temperature(resistance, coefficients=IEC_60751, iterations=3):
+    """
+    Convert resistance in Ohm to temperature in *C (Callendar-Van Dusen).
+
+    T >= 0: closed-form solution of the quadratic equation.
+    T < 0: Newton iterations on the full equation, starting from the quadratic solution.
+    """
+
+    r0, a, b, c = coefficients
+    r = np.asarray(resistance, dtype=np.float64)
+    t = (-a + np.sqrt(a * a - 4 * b * (1 - r / r0))) / (2 * b)
+    negative = r < r0
+    if c and np.any(negative):
+        tn = t[negative] if t.ndim else t
+        rn = r[negative] if r.ndim else r
+        for _ in range(iterations):
+            f = r0 * (1 + a * tn + b * tn**2 + c * (tn - 100) * tn**3) - rn
+            df = r0 * (a + 2 * b * tn + c * (4 * tn**3 - 300 * tn**2))
+            tn = tn - f / df
+        if t.ndim:
+            t[negative] = tn
+        else:
+            t = tn
+    return t
+
+def fault_bits(fault):
+    """Pack fault tuple of MAX31865 (6 flags, MSB first as in fault status register) into int."""
+
+    bits = 0
+    for flag in fault:
+        bits = (bits << 1) | bool(flag)
+    return bits << 2
+
+def load_coefficients(con):
+    """
+    Get latest Callendar-Van Dusen coefficients of all sensors from calibration table.
+
+    Return:
+    dict: {sensor_name: (R0, A, B, C)}
+    """
+
+    cur = con.cursor()
+    cur.execute("""SELECT DISTINCT ON (s.name) s.name, c.data FROM calibration c JOIN sensor s ON s.id = c.sensor_id
+                   WHERE c.header = %s ORDER BY s.name, c.timestamp DESC""", [HEADER])
+    ret = {name: tuple(data) for name, data in cur.fetchall()}
+    cur.close()
+    con.commit()
+    return ret
+
+def reprocess(con, session_id, sensor, coefficients=None, ref_resistor=430.0, batch_size=1000):
+    """
+    Recompute temperatures of raw measurements of sensor in session.
+
+    coefficients: (R0, A, B, C), default latest coefficients of sensor in calibration table (or IEC 60751).
+
+    Yield:
+    np_array[n] of datetime64[s] timestamps, np_array[n][samples] temperatures, np_array[n][samples] fault bits
+    """
+
+    if coefficients is None:
+        coefficients = load_coefficients(con).get(sensor, IEC_60751)
+    exporter = Exporter.SessionExporter(con, batch_size)
+    for timestamps, data in exporter.iter_batches(session_id, sensor):
+        # raw measurements: data[samples][code, fault, temperature]
+        if data.ndim != 3:
+            continue
+        yield timestamps, temperature(resistance(data[..., 0], ref_resistor), coefficients), data[..., 1].astype(np.int64)
@@ -0,0 +1,263 @@
+"""
+Rollup tables of measurements per minute and hour.
+
+For every sensor, session and time bucket the rollup table stores mean, min, max and count
+of every data channel. Sweeps (data[points][columns] with frequency in column 0) are rolled up
+per frequency, other sensors (data[columns] or batches data[samples][columns]) use frequency 0.
+
+DBSaver updates the rollups incrementally with every saved measurement,
+query() reads a series at the finest resolution that fits into a point budget.
+"""
+
+import datetime
+import numpy as np
+from psycopg2.extras import execute_values
+import Exporter
+
+"""Header of column 0 that marks data as frequency sweep."""
+FREQUENCY_HEADERS = ("Frequenz", "Frequency")
+
+"""Rollup resolutions from fine to coarse: (name, function to truncate timestamp to bucket)."""
+RESOLUTIONS = [
+    ("minute", lambda t: t.replace(second=0, microsecond=0)),
+    ("hour", lambda t: t.replace(minute=0, second=0, microsecond=0)),
+]
+
+UPSERT = """INSERT INTO rollup(resolution, sensor_id, session_id, bucket, channel, frequency, mean, min, max, sum, count)
+            VALUES %s
+            ON CONFLICT (resolution, session_id, sensor_id, bucket, channel, frequency) DO UPDATE SET
+                sum = rollup.sum + EXCLUDED.sum,
+                count = rollup.count + EXCLUDED.count,
+                mean = (rollup.sum + EXCLUDED.sum) / (rollup.count + EXCLUDED.count),
+                min = LEAST(rollup.min, EXCLUDED.min),
+                max = GREATEST(rollup.max, EXCLUDED.max)"""
+
+def rollup_rows(sensor_id, session_id, timestamp, data, header=None):
+    """
+    Convert a single measurement into rollup rows of all resolutions.
+
+    Return:
+    [tuple]: rows in column order of UPSERT
+    """
+
+    values = np.asarray(data, dtype=np.float64)
+    stats = []
+    if values.ndim == 2 and header and header[0] in FREQUENCY_HEADERS:
+        # sweep: column 0 is frequency, columns 1.. are channels
+        for (i, c), value in np.ndenumerate(values[:, 1:]):
+            if not np.isnan(value):
+                value = float(value)
+                stats.append((c + 1, float(values[i, 0]), value, value, value, value, 1))
+    else:
+        # scalar or batch of samples: statistics per channel
+        values = values.reshape(-1, values.shape[-1]) if values.ndim else values.reshape(1, 1)
+        for c in range(values.shape[1]):
+            column = values[:, c]
+            column = column[~np.isnan(column)]
+            if len(column):
+                total = float(column.sum())
+                stats.append((c, 0.0, total / len(column), float(column.min()), float(column.max()), total, len(column)))
+
+    rows = []
+    for resolution, truncate in RESOLUTIONS:
+        bucket = truncate(timestamp)
+        rows.extend((resolution, sensor_id, session_id, bucket) + stat for stat in stats)
+    return rows
+
+def update(cur, measurements):
+    """
+    Add measurements to rollup tables.
+
+    measurements: iterable of (sensor_id, session_id, timestamp, data, header)
+    Note: Runs on the cursor of the caller, so rollups are committed together with the measurements.
+    """
+
+    rows = []
+    for sensor_id, session_id, timestamp, data, header in measurements:
+        rows.extend(rollup_rows(sensor_id, session_id, timestamp, data, header))
+    if rows:
+        # merge rows of same key beforehand, ON CONFLICT cannot update a row twice per statement
+        execute_values(cur, UPSERT, merge_rows(rows), page_size=1000)
+
+def merge_rows(rows):
+    """Combine rollup rows with identical key."""
+
+    merged = {}
+    for row in rows:
+        key = row[:6]
+        if key in merged:
+            _, mn, mx, sm, cnt = merged[key]
+            sm += row[9]
+            cnt += row[10]
+            merged[key] = (sm / cnt, min(mn, row[7]), max(mx, row[8]), sm, cnt)
+        else:
+            merged[key] = row[6:]
+    return [key + value for key, value in merged.items()]
+
+def rebuild(con, session_id, batch_size=1000, commit=True):
+    """
+    Recompute rollups of session from raw measurements (e.g. for sessions recorded before rollups existed).
+
+    Deleting and recomputing runs in a single transaction, a failed rebuild keeps the old rollups.
+    With commit=False the transaction is left open for the caller.
+    """
+
+    cur = con.cursor()
+    try:
+        cur.execute("DELETE FROM rollup WHERE session_id = %s", [session_id])
+        cur.execute("SELECT DISTINCT s.id, s.name FROM measurement m JOIN sensor s ON s.id = m.sensor_id WHERE m.session_id = %s", [session_id])
+        sensors = cur.fetchall()
+
+        # read inside this transaction, committing would close the named cursor
+        exporter = Exporter.SessionExporter(con, batch_size, rollback=False)
+        for sensor_id, sensor in sensors:
+            batch = []
+            for _, timestamp, header, data, _ in exporter.iter_rows(session_id, sensor):
+                batch.append((sensor_id, session_id, Exporter.to_datetime64(timestamp).astype(datetime.datetime), data, header))
+                if len(batch) == batch_size:
+                    update(cur, batch)
+                    batch = []
+            update(cur, batch)
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        cur.close()
+    if commit:
+        con.commit()
+
+def verify(con, session_id, batch_size=1000):
+    """
+    Check that rebuild() reproduces the incrementally built rollups of session.
+    The rebuild is rolled back, stored rollups stay untouched.
+
+    Return:
+    [tuple]: keys (resolution, session_id, sensor_id, bucket, channel, frequency) of differing rollup rows
+    """
+
+    select = "SELECT resolution, session_id, sensor_id, bucket, channel, frequency, mean, min, max, sum, count FROM rollup WHERE session_id = %s"
+    cur = con.cursor()
+    try:
+        cur.execute(select, [session_id])
+        stored = {row[:6]: row[6:] for row in cur.fetchall()}
+        rebuild(con, session_id, batch_size, commit=False)
+        cur.execute(select, [session_id])
+        rebuilt = {row[:6]: row[6:] for row in cur.fetchall()}
+    finally:
+        cur.close()
+        con.rollback()
+
+    diff = []
+    for key in sorted(stored.keys() | rebuilt.keys(), key=repr):
+        a, b = stored.get(key), rebuilt.get(key)
+        # sums are accumulated in different order, compare with tolerance
+        if a is None or b is None or a[4] != b[4] or not np.allclose(a[:4], b[:4], equal_nan=True):
+            diff.append(key)
+    return diff
+
+def query(con, session_id, sensor, max_points, channel=None, frequency=None, start=None, stop=None):
+    """
+    Get series of a sensor channel at the finest resolution with at most max_points timestamps.
+
+    Resolutions are tried in order raw, minute, hour. If no resolution fits, hour is returned.
+    For sweeps, frequency selects a single frequency, otherwise all frequencies are returned.
+    Scalar sensors number their channels from 0, sweeps from 1 (column 0 is frequency).
+    channel: default first channel (0 for scalar sensors, 1 for sweeps)
+
+    Return:
+    dict: resolution, timestamp, frequency, mean, min, max, count (np_arrays of equal length)
+    """
+
+    sweep = _is_sweep(con, session_id, sensor)
+    if channel is None:
+        channel = 1 if sweep else 0
+    exporter = Exporter.SessionExporter(con)
+    if exporter.count(session_id, sensor, start, stop) <= max_points:
+        return _query_raw(exporter, session_id, sensor, sweep, channel, frequency, start, stop)
+
+    cur = con.cursor()
+    for resolution, _ in RESOLUTIONS:
+        where, params = _where(resolution, session_id, sensor, channel, frequency, start, stop)
+        cur.execute("SELECT COUNT(DISTINCT bucket) FROM rollup r JOIN sensor s ON s.id = r.sensor_id " + where, params)
+        if cur.fetchone()[0] <= max_points or resolution == RESOLUTIONS[-1][0]:
+            break
+    cur.execute("SELECT bucket, frequency, mean, min, max, count FROM rollup r JOIN sensor s ON s.id = r.sensor_id " + where + " ORDER BY bucket, frequency", params)
+    rows = cur.fetchall()
+    cur.close()
+    con.commit()
+
+    columns = list(zip(*rows)) if rows else [[]] * 6
+    return {
+                "resolution": resolution,
+                "timestamp": np.array([Exporter.to_datetime64(t) for t in columns[0]], dtype="datetime64[s]"),
+                "frequency": np.array(columns[1], dtype=np.float64),
+                "mean": np.array(columns[2], dtype=np.float64),
+                "min": np.array(columns[3], dtype=np.float64),
+                "max": np.array(columns[4], dtype=np.float64),
+                "count": np.array(columns[5], dtype=np.int64),
+            }
+
+def _where(resolution, session_id, sensor, channel, frequency, start, stop):
+    """Build WHERE clause on rollup table."""
+
+    where = "WHERE r.resolution = %s AND r.session_id = %s AND s.name = %s AND r.channel = %s"
+    params = [resolution, session_id, sensor, channel]
+    if frequency is not None:
+        where += " AND r.frequency = %s"
+        params.append(frequency)
+    if start is not None:
+        where += " AND r.bucket >= %s"
+        params.append(start)
+    if stop is not None:
+        where += " AND r.bucket < %s"
+        params.append(stop)
+    return where, params
+
+def _is_sweep(con, session_id, sensor):
+    """Return True if measurements of sensor in session are frequency sweeps."""
+
+    cur = con.cursor()
+    cur.execute("SELECT m.header FROM measurement m JOIN sensor s ON s.id = m.sensor_id WHERE m.session_id = %s AND s.name = %s LIMIT 1", [session_id, sensor])
+    row = cur.fetchone()
+    cur.close()
+    return bool(row and row[0] and row[0][0] in FREQUENCY_HEADERS)
+
+def _query_raw(exporter, session_id, sensor, sweep, channel, frequency, start, stop):
+    """Get raw series in the format of query()."""
+
+    timestamps, frequencies, values = [], [], []
+    for ts, data in exporter.iter_batches(session_id, sensor, start, stop):
+        if not 0 <= channel < data.shape[-1]:
+            raise ValueError("Channel %d out of range, %s has %d data columns" % (channel, sensor, data.shape[-1]))
+        if data.ndim == 3 and not sweep:
+            # batches of samples: data[measurements][samples][columns], samples share the timestamp
+            value = data[:, :, channel]
+            ts = np.repeat(ts, value.shape[1])
+            frequencies.append(np.zeros(value.size))
+            values.append(value.ravel())
+        elif data.ndim == 3:
+            # sweep: data[measurements][points][columns]
+            freq = data[:, :, 0]
+            value = data[:, :, channel]
+            if frequency is not None:
+                mask = freq == frequency
+                ts, freq, value = np.broadcast_to(ts[:, None], freq.shape)[mask], freq[mask], value[mask]
+            else:
+                ts = np.repeat(ts, freq.shape[1])
+            frequencies.append(freq.ravel())
+            values.append(value.ravel())
+        else:
+            frequencies.append(np.zeros(len(ts)))
+            values.append(data[:, channel])
+        timestamps.append(ts)
+
+    value = np.concatenate(values) if values else np.array([], dtype=np.float64)
+    return {
+                "resolution": "raw",
+                "timestamp": np.concatenate(timestamps) if timestamps else np.array([], dtype="datetime64[s]"),
+                "frequency": np.concatenate(frequencies) if frequencies else np.array([], dtype=np.float64),
+                "mean": value,
+                "min": value,
+                "max": value,
+                "count": np.ones(len(value), dtype=np.int64),
+            }
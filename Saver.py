@@ -1,10 +1,14 @@
 from shutil import copyfile
 import psycopg2
 import Helper
+import Migrations
+import Rollup
+import Collector
+import socket
 import os, errno
 import csv
 import glob
-from numpy import *
+import numpy as np
 
 class DBSaver():
     """Class to handle Database communication."""
@@ -12,50 +16,82 @@ class DBSaver():
     def __init__(self):
         self.session_id = None
         self.con = None
+        # update rollup tables with every saved measurement
+        self.rollups = True
+        # reason of last failed connect
+        self.error = None
 
-    def connect(self, user, password):
+    def connect(self, user, password, dbname="tacdb", host="localhost", check_schema=True):
         """
         Establish connection and store reference to it.
+
+        check_schema: fail if the database is not migrated to the latest version (see Migrations.py).
         
         Return:
-        bool: True (connection successful), False (connection failed)
+        bool: True (connection successful), False (connection failed, reason in self.error)
         """
 
-        msg = "dbname=tacdb user=%s password=%s host=localhost port=5432" % (user, password)
+        msg = "dbname=%s user=%s host=%s port=5432" % (dbname, user, host)
+        # without password libpq falls back to ~/.pgpass or PGPASSWORD
+        if password is not None:
+            msg += " password=%s" % password
         try:
             self.con = psycopg2.connect(msg)
-            return True
         except:
+            self.error = "Connection failed"
             return False
+        if check_schema:
+            try:
+                version = Migrations.current_version(self.con)
+            except psycopg2.Error:
+                self.con.rollback()
+                version = None
+            if version != Migrations.MIGRATIONS[-1][0]:
+                self.error = "Database schema outdated (version %s of %d).\nRun python3 Migrations.py --user %s" % (version, Migrations.MIGRATIONS[-1][0], user)
+                self.con.close()
+                self.con = None
+                return False
+        self.error = None
+        return True
 
     def add_sensors(self, sensors):
         """Add specified sensor names to database if not exist."""
 
         cur = self.con.cursor()
         for sensor in sensors:
-            s_exist = "SELECT EXISTS(SELECT 1 FROM sensor WHERE name='%s')" % sensor
-            cur.execute(s_exist)
-            if not cur.fetchone()[0]:
-                cur.execute("INSERT INTO sensor(name) VALUES(%s)", [sensor])
+            # unique index on sensor.name makes this safe against concurrent writers
+            cur.execute("INSERT INTO sensor(name) VALUES(%s) ON CONFLICT (name) DO NOTHING", [sensor])
         cur.close()
         self.con.commit()
 
-    def new_session(self):
-        """Add new session entry to database after latest session entry."""
+    def new_session(self, device=None):
+        """Add new session entry to database, session id is assigned by the database."""
 
         cur = self.con.cursor()
-        cur.execute("SELECT 1 FROM session LIMIT 1")
-        if cur.fetchone():
-            cur.execute("SELECT id FROM session ORDER BY timestamp DESC LIMIT 1")
-            self.session_id = cur.fetchone()[0]
-            self.session_id += 1
-        else:
-            self.session_id = 1
-
-        cur.execute("INSERT INTO session(timestamp) VALUES(%s)", [Helper.get_timestamp()])
+        cur.execute("INSERT INTO session(timestamp, device) VALUES(now(), %s) RETURNING id", [device])
+        self.session_id = cur.fetchone()[0]
         cur.close()
         self.con.commit()
+        # keep partitions of measurement table ahead of time (no-op if not partitioned)
+        Migrations.ensure_partitions(self.con)
             
+    def resume_session(self, session_id):
+        """
+        Continue existing session entry.
+
+        Return:
+        bool: True (session exists), False (session not found)
+        """
+
+        cur = self.con.cursor()
+        cur.execute("SELECT EXISTS(SELECT 1 FROM session WHERE id=%s)", [session_id])
+        exists = cur.fetchone()[0]
+        cur.close()
+        self.con.commit()
+        if exists:
+            self.session_id = session_id
+        return exists
+
     def get_sensor_id(self, sensor_name):
         """
         Get Sensor ID from database for specified sensor_name.
@@ -74,24 +110,44 @@ class DBSaver():
         cur.close()
         return ret
 
-    def save_measurement(self, session_data):
-        """Save measurement to database."""
+    def save_measurement(self, session_data, heartbeats=()):
+        """
+        Save measurement to database.
 
-        cur = self.con.cursor()
-        for sensor_data in session_data:
-            # convert np array to python array
-            if isinstance(sensor_data["data"], ndarray):
-                sensor_data["data"] = sensor_data["data"].tolist()
-            sensor_data_array = list(sensor_data.values())
-            # replace sensor_name with sensor_id
-            sensor_name = sensor_data_array[0]
-            sensor_id = self.get_sensor_id(sensor_name)
-            sensor_data_array[0] = sensor_id
-            sensor_data_array.append(self.session_id)
-
-            cur.execute("INSERT INTO measurement(sensor_id, timestamp, header, data, units, session_id) VALUES(%s,%s,%s,%s,%s,%s)", sensor_data_array)
-        cur.close()
-        self.con.commit()
+        heartbeats: events skipped by change detection, only their timestamp is stored.
+        (Their data is not rolled up either, so Rollup.rebuild reproduces the rollups.)
+        """
+
+        try:
+            cur = self.con.cursor()
+            rollups = []
+            for sensor_data in session_data:
+                # convert np array to python array
+                if isinstance(sensor_data["data"], np.ndarray):
+                    sensor_data["data"] = sensor_data["data"].tolist()
+                sensor_data_array = list(sensor_data.values())
+                # replace sensor_name with sensor_id
+                sensor_name = sensor_data_array[0]
+                sensor_id = self.get_sensor_id(sensor_name)
+                sensor_data_array[0] = sensor_id
+                sensor_data_array[1] = Helper.parse_timestamp(sensor_data_array[1])
+                sensor_data_array.append(self.session_id)
+
+                cur.execute("INSERT INTO measurement(sensor_id, timestamp, header, data, units, session_id) VALUES(%s,%s,%s,%s,%s,%s)", sensor_data_array)
+                rollups.append((sensor_id, self.session_id, sensor_data_array[1], sensor_data["data"], sensor_data["header"]))
+            for event in heartbeats:
+                sensor_id = self.get_sensor_id(event["id"])
+                timestamp = Helper.parse_timestamp(event["timestamp"])
+                cur.execute("INSERT INTO heartbeat(sensor_id, session_id, timestamp) VALUES(%s,%s,%s)", [sensor_id, self.session_id, timestamp])
+            if self.rollups:
+                Rollup.update(cur, rollups)
+            cur.close()
+            self.con.commit()
+        except psycopg2.Error:
+            # aborted transaction would fail all following saves
+            if not self.con.closed:
+                self.con.rollback()
+            raise
 
     def save_calibration(self, calibration_data):
         """Save Calibration to database."""
@@ -103,8 +159,113 @@ class DBSaver():
         sensor_name = calib_data_array[0]
         sensor_id = self.get_sensor_id(sensor_name)
         calib_data_array[0] = sensor_id
+        calib_data_array[1] = Helper.parse_timestamp(calib_data_array[1])
 
         cur.execute("INSERT INTO calibration(sensor_id, timestamp, header, data, units) VALUES(%s,%s,%s,%s,%s)", calib_data_array)
         cur.close()
         # save changes to DB
         self.con.commit()
+
+class CollectorSaver():
+    """
+    Class to save measurements through an ingest collector (see Collector.py) instead of a direct database connection.
+
+    Provides the interface of DBSaver. Sessions are tagged with the device name.
+    """
+
+    def __init__(self, address, device=None):
+        self.address = address
+        self.device = device if device is not None else socket.gethostname()
+        self.session_id = None
+        self.sock = None
+
+    def __request(self, message):
+        """
+        Send message to collector and wait for reply.
+        On a broken connection (e.g. collector restarted) reconnect and send once more.
+
+        Return:
+        dict: reply
+        """
+
+        try:
+            reply = self.__exchange(message)
+        except OSError:
+            self.close()
+            if not self.connect():
+                raise ConnectionError("Collector %s:%d not reachable" % tuple(self.address))
+            reply = self.__exchange(message)
+        if not reply["ok"] and reply.get("error"):
+            raise RuntimeError(reply["error"])
+        return reply
+
+    def __exchange(self, message):
+        """Send message and receive reply on current connection."""
+
+        if self.sock is None:
+            raise ConnectionError("Not connected to collector")
+        Collector.send_frame(self.sock, message)
+        reply = Collector.recv_frame(self.sock)
+        if reply is None:
+            raise ConnectionError("Collector closed connection")
+        return reply
+
+    def connect(self, user=None, password=None):
+        """
+        Establish connection to collector. (Credentials are held by the collector, user and password are ignored.)
+
+        Return:
+        bool: True (connection successful), False (connection failed)
+        """
+
+        try:
+            self.sock = socket.create_connection(self.address, timeout=120)
+            return True
+        except OSError:
+            return False
+
+    def close(self):
+        """Close connection to collector."""
+
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+    def add_sensors(self, sensors):
+        """Add specified sensor names to database if not exist."""
+
+        self.__request({"type": "hello", "device": self.device, "sensors": list(sensors)})
+
+    def new_session(self):
+        """Get new session id from collector."""
+
+        self.session_id = self.__request({"type": "session", "device": self.device})["session_id"]
+
+    def resume_session(self, session_id):
+        """
+        Continue existing session of this device.
+
+        Return:
+        bool: True (session exists), False (session not found)
+        """
+
+        if self.__request({"type": "resume", "device": self.device, "session_id": session_id})["ok"]:
+            self.session_id = session_id
+            return True
+        return False
+
+    def save_measurement(self, session_data, heartbeats=()):
+        """Send measurements (and heartbeats of change detection) as one frame, return after collector committed it."""
+
+        self.__request({
+                        "type": "measurements",
+                        "device": self.device,
+                        "session_id": self.session_id,
+                        "events": [Collector.to_message(event) for event in session_data],
+                        "heartbeats": [{"id": event["id"], "timestamp": event["timestamp"]} for event in heartbeats]
+                    })
+
+    def save_calibration(self, calibration_data):
+        """Save Calibration through collector."""
+
+        self.__request({"type": "calibration", "device": self.device, "event": Collector.to_message(calibration_data)})
@@ -1,8 +1,32 @@
 import Helper
 import time
-import numpy as np
-import usbtmc
-import board, busio, digitalio, adafruit_max31865
+
+"""
+Sweep profiles of Keysight E4990A.
+
+points: number of points per sweep, aperture: measurement time level 1 (fast) to 5 (precise),
+start/stop: frequency span in Hz, type: LIN or LOG,
+segments: optional segment table [(start, stop, points, aperture)], replaces points/start/stop/type.
+"""
+SWEEP_PROFILES = {
+    "precise": {"points": 201, "aperture": 2, "start": 20, "stop": 120E6, "type": "LOG", "segments": None},
+    "monitor": {"points": 51, "aperture": 1, "start": 20, "stop": 120E6, "type": "LOG", "segments": None},
+}
+
+class SweepSchedule():
+    """Select sweep profile by measurement cycle: precise profile every n-th cycle, base profile otherwise."""
+
+    def __init__(self, base="monitor", precise="precise", every=10):
+        self.base = base
+        self.precise = precise
+        self.every = every
+
+    def profile(self, cycle):
+        """Return name of sweep profile for measurement cycle."""
+
+        if self.every and cycle % self.every == 0:
+            return self.precise
+        return self.base
 
 class Sensor(object):
     """
@@ -55,16 +79,28 @@ class Sensor(object):
 class KeysightE4990A(Sensor):
     """Class for Keysight E4990A connected via USB."""
 
-    def __init__(self, addr):
+    def __init__(self, addr, profile="precise", transport=None):
+        """
+        Connect to Keysight E4990A at USB addr [vendor id, product id].
+
+        transport: SCPI transport with write/ask (see Transport.py), default USB via usbtmc.
+        """
+
         super().__init__()
+        self.profile = None
+        # last measured sweep time in seconds per profile
+        self.sweep_times = {}
         self._info["calibratable"] = 1
-        self._info["link"] = usbtmc.Instrument(addr[0], addr[1])
+        if transport is None:
+            import Transport
+            transport = Transport.UsbtmcTransport(addr)
+        self._info["link"] = transport
         self._info["interface"] = "USB/SCPI"
         self._info["type"] = "Impedancer"
         self._info["id"] = self.__ask("*IDN?")
         # set usb timeout to 2 mins
         self._info["link"].timeout = 120 * 1000
-        self.__setup()
+        self.__setup(profile)
 
     def __send(self, msg):
         """Send msg to Keysight E4990A."""
@@ -86,9 +122,10 @@ class KeysightE4990A(Sensor):
     def __as_array(self, cmd):
         """Send cmd to Keysight E4990A, return answer as np.array."""
 
+        import numpy as np
         return np.array([self.__ask(cmd).split(",")]).astype(np.float64)
     
-    def __setup(self):  
+    def __setup(self, profile):  
         """Set Parameters on Keysight E4990A."""
 
         # initiate registers for polling
@@ -108,12 +145,9 @@ class KeysightE4990A(Sensor):
         # setup measurement environment
         self.__send(":CALC1:PAR1:DEF CP")
         self.__send(":CALC1:PAR2:DEF D")
-        self.__send(":SENS1:APER 2")    # set precision
+        self.apply_profile(profile)
 
         # setup display on Keysight 4990A
-        self.__send(":SENS1:SWE:TYPE LOG")
-        self.__send(":SENS1:FREQ:START 20")
-        self.__send(":SENS1:FREQ:STOP 120E6")
         self.__send(":SENS1:CORR2:CKIT:LOAD:R 100")
         self.__send(":DISP:WINDOW1:Y:SCALE:DIV 10")
         self.__send(":DISP:WINDOW1:TRACE1:Y:SCALE:RPOS 5")
@@ -123,6 +157,31 @@ class KeysightE4990A(Sensor):
         self.__send(":DISP:WINDOW1:TRACE2:Y:SCALE:PDIV 200")
         self.__send(":DISP:WINDOW1:TRACE2:Y:SCALE:RLEVEL 400")
 
+    def apply_profile(self, name):
+        """
+        Set sweep parameters of profile name (see SWEEP_PROFILES).
+
+        Note: Only sweep settings are sent (no *RST), switching profiles between measurements is cheap.
+        """
+
+        if name == self.profile:
+            return
+        profile = SWEEP_PROFILES[name]
+        if profile["segments"]:
+            # segment table: format 8, start/stop mode, per segment aperture on, osc level/bias/delay off
+            data = [8, 0, 1, 0, 0, 0, len(profile["segments"])]
+            for start, stop, points, aperture in profile["segments"]:
+                data += [start, stop, points, aperture]
+            self.__send(":SENS1:SEGM:DATA " + ",".join("%g" % d for d in data))
+            self.__send(":SENS1:SWE:TYPE SEGM")
+        else:
+            self.__send(":SENS1:SWE:TYPE %s" % profile["type"])
+            self.__send(":SENS1:SWE:POIN %d" % profile["points"])
+            self.__send(":SENS1:FREQ:START %g" % profile["start"])
+            self.__send(":SENS1:FREQ:STOP %g" % profile["stop"])
+            self.__send(":SENS1:APER %d" % profile["aperture"])    # set precision
+        self.profile = name
+
     """Alternative polling method. (Might be useful)"""
     # def __poll(self):
     #     # self.__send("*OPC?")
@@ -152,7 +211,10 @@ class KeysightE4990A(Sensor):
         header[3], data[points][3], units[3]
         """
 
+        import numpy as np
+        start = time.perf_counter()
         self.__poll()
+        self.sweep_times[self.profile] = time.perf_counter() - start
         freq = self.__as_array(":SENS1:FREQ:DATA?")
         data = {}
         for i in range(1,3):
@@ -168,10 +230,21 @@ class KeysightE4990A(Sensor):
 class PT100(Sensor):
     """Class for PT100 Temperature Sensors connected via SPI."""
 
-    def __init__(self, cs_pin):
+    def __init__(self, cs_pin, raw=False, batch=1):
+        """
+        Connect to MAX31865 with chip select cs_pin.
+
+        raw: capture raw ADC codes and fault bits of batch samples per read,
+        temperature is converted vectorized with coefficients (see RTD.py).
+        """
+
         super().__init__()
 
+        self.raw = raw
+        self.batch = batch
+        self.coefficients = None
         self._info["calibratable"] = 0
+        import board, busio, digitalio, adafruit_max31865
         spi = busio.SPI(board.SCK, MOSI=board.MOSI, MISO=board.MISO)
         cs = digitalio.DigitalInOut(getattr(board,cs_pin))
 
@@ -188,7 +261,38 @@ class PT100(Sensor):
         [string],[float],[string]
         """
 
+        if self.raw:
+            return self.__get_raw()
         data = [self._info["link"].temperature]
         header = ["Temperature"]
         unit = ["*C"]
         return header, data,  unit
+
+    def set_coefficients(self, coefficients):
+        """Set Callendar-Van Dusen coefficients (R0, A, B, C) for raw mode, None for IEC 60751."""
+
+        self.coefficients = coefficients
+
+    def __get_raw(self):
+        """
+        Capture batch raw samples, convert them to temperature in one step.
+
+        Return:
+        [string], data[batch][3] with columns [RTD code, Fault, Temperature], [string]
+        """
+
+        import numpy as np
+        import RTD
+        link = self._info["link"]
+        codes = np.empty(self.batch)
+        faults = np.zeros(self.batch)
+        for i in range(self.batch):
+            codes[i] = link.read_rtd()
+            fault = link.fault
+            if any(fault):
+                faults[i] = RTD.fault_bits(fault)
+                link.clear_faults()
+        coefficients = self.coefficients or (link.rtd_nominal,) + RTD.IEC_60751[1:]
+        temperatures = RTD.temperature(RTD.resistance(codes, link.ref_resistor), coefficients)
+        data = np.column_stack((codes, faults, temperatures))
+        return RTD.RAW_HEADER, data, ["-", "-", "*C"]
@@ -0,0 +1,251 @@
+"""
+Soak test of the measurement pipeline on an accelerated virtual clock.
+
+Runs the real Controller, Filters and DBSaver (against a PostgreSQL test database) with
+simulated sensors. The virtual clock advances by one measurement interval per cycle,
+so weeks of measurements pass in minutes. Every sample_every cycles RSS, traced python memory,
+open file descriptors and cycle latency are recorded. The run fails (exit code 1) if growth
+after warm-up exceeds the budgets or if rebuilding the rollups of the session
+does not reproduce the incrementally built ones.
+
+Usage:
+python3 Soak.py --user postgres --dbname tacdb_soak --interval 60 --days 14
+"""
+
+import argparse
+import getpass
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+from PyQt5.QtCore import QTime
+from PyQt5.QtWidgets import QApplication
+from Managers import SensorManager
+from Controller import Controller
+from Sensors import Sensor
+from Filters import Deadband
+import Helper
+import Migrations
+import Rollup
+import Saver
+
+class VirtualClock():
+    """Clock that only advances when told to."""
+
+    def __init__(self, start=None):
+        self.now = time.time() if start is None else start
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+class SimulatedImpedance(Sensor):
+    """Simulated Keysight E4990A: slowly drifting C and D values on a log frequency sweep."""
+
+    def __init__(self, points=201, seed=0):
+        super().__init__()
+        self._info["calibratable"] = 1
+        self._info["interface"] = "simulated"
+        self._info["type"] = "Impedancer"
+        self._info["id"] = "SIM_E4990A"
+        self.rng = np.random.default_rng(seed)
+        self.freq = np.logspace(np.log10(20), np.log10(120E6), points)
+        self.cycle = 0
+
+    def _get(self):
+        self.cycle += 1
+        drift = 1 + 0.01 * np.sin(self.cycle / 500)
+        c = 1E-11 * drift * (1 + 1E-4 * self.rng.standard_normal(len(self.freq)))
+        d = 1E-3 * drift * (1 + 1E-3 * self.rng.standard_normal(len(self.freq)))
+        data = np.column_stack((self.freq, c, d))
+        return ["Frequenz", "C-Wert", "D-Wert"], data, ["Hz", "F", "-"]
+
+class SimulatedRTD(Sensor):
+    """Simulated PT100: temperature with daily cycle and noise."""
+
+    def __init__(self, name, seed=0):
+        super().__init__()
+        self._info["calibratable"] = 0
+        self._info["interface"] = "simulated"
+        self._info["type"] = "RTD"
+        self._info["id"] = "SIM_%s" % name
+        self.rng = np.random.default_rng(seed)
+
+    def _get(self):
+        t = Helper.clock()
+        temperature = 20 + 2 * np.sin(2 * np.pi * t / 86400) + 0.02 * self.rng.standard_normal()
+        return ["Temperature"], [float(temperature)], ["*C"]
+
+class SimulatedSensorManager(SensorManager):
+    """SensorManager with simulated sensors."""
+
+    def create_sensors(self):
+        ia = SimulatedImpedance()
+        rtd1 = SimulatedRTD("D5", seed=1)
+        rtd2 = SimulatedRTD("D6", seed=2)
+        self.sensors = {
+                            "Keysight": ia,
+                            "PT100_1": rtd1,
+                            "PT100_2": rtd2
+                       }
+        self.deadbands = {
+                            ia.property["id"]: Deadband(rel=1e-3, max_gap=3600),
+                            rtd1.property["id"]: Deadband(abs=0.05, max_gap=3600),
+                            rtd2.property["id"]: Deadband(abs=0.05, max_gap=3600)
+                         }
+        calibratable = [sensor.property["calibratable"] for sensor in self.sensors.values()]
+        return [*self.sensors], calibratable
+
+class NullView():
+    """View without widgets, accepts all calls of Controller."""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+def rss_mb():
+    """Return resident set size of this process in MB."""
+
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def open_fds():
+    """Return number of open file descriptors of this process."""
+
+    return len(os.listdir("/proc/self/fd"))
+
+def run(ctrl, clock, interval, cycles, sample_every, app):
+    """
+    Run measurement cycles on virtual clock.
+
+    Return:
+    [dict]: samples of cycle, rss, traced memory, open fds and median latency
+    """
+
+    samples = []
+    latencies = []
+    for cycle in range(1, cycles + 1):
+        clock.advance(interval)
+        # emulate timeout of interval timer
+        ctrl.interval_timer.cnt += 1
+        start = time.perf_counter()
+        ctrl.measure_all()
+        latencies.append(time.perf_counter() - start)
+        app.processEvents()
+
+        if cycle % sample_every == 0:
+            samples.append({
+                                "cycle": cycle,
+                                "rss_mb": rss_mb(),
+                                "traced_mb": tracemalloc.get_traced_memory()[0] / 2**20,
+                                "fds": open_fds(),
+                                "latency_ms": statistics.median(latencies) * 1000
+                            })
+            latencies = []
+            s = samples[-1]
+            print("cycle %7d  rss %7.1f MB  traced %7.1f MB  fds %4d  latency %7.2f ms" % (s["cycle"], s["rss_mb"], s["traced_mb"], s["fds"], s["latency_ms"]))
+    return samples
+
+def check(samples, warmup, args):
+    """
+    Compare growth after warm-up against budgets.
+
+    Return:
+    [string]: violated budgets
+    """
+
+    base = [s for s in samples if s["cycle"] > warmup]
+    if len(base) < 2:
+        return ["Not enough samples after warm-up."]
+    first, last = base[0], base[-1]
+    failures = []
+    if last["rss_mb"] - first["rss_mb"] > args.rss_budget:
+        failures.append("RSS grew by %.1f MB (budget %.1f MB)" % (last["rss_mb"] - first["rss_mb"], args.rss_budget))
+    if last["traced_mb"] - first["traced_mb"] > args.traced_budget:
+        failures.append("Traced memory grew by %.1f MB (budget %.1f MB)" % (last["traced_mb"] - first["traced_mb"], args.traced_budget))
+    if last["fds"] - first["fds"] > args.fd_budget:
+        failures.append("Open file descriptors grew by %d (budget %d)" % (last["fds"] - first["fds"], args.fd_budget))
+    drift = last["latency_ms"] / first["latency_ms"] if first["latency_ms"] else 1.0
+    if drift > args.latency_budget:
+        failures.append("Cycle latency drifted by factor %.2f (budget %.2f)" % (drift, args.latency_budget))
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test of the measurement pipeline on a virtual clock.")
+    parser.add_argument("--user", default="postgres")
+    parser.add_argument("--password", default=None, help="prompted for if omitted")
+    parser.add_argument("--dbname", default="tacdb_soak", help="test database, gets migrated and written to")
+    parser.add_argument("--interval", type=float, default=60, help="virtual measurement interval in seconds")
+    parser.add_argument("--days", type=float, default=14, help="virtual duration of session")
+    parser.add_argument("--sample-every", type=int, default=500, help="cycles between samples")
+    parser.add_argument("--warmup", type=int, default=1000, help="cycles excluded from budgets")
+    parser.add_argument("--rss-budget", type=float, default=20, help="max RSS growth in MB")
+    parser.add_argument("--traced-budget", type=float, default=5, help="max growth of traced python memory in MB")
+    parser.add_argument("--fd-budget", type=int, default=2, help="max growth of open file descriptors")
+    parser.add_argument("--latency-budget", type=float, default=1.5, help="max ratio of last to first cycle latency")
+    parser.add_argument("--top", type=int, default=10, help="number of top allocators to show")
+    args = parser.parse_args()
+
+    password = args.password
+    if password is None:
+        password = getpass.getpass()
+
+    app = QApplication([])
+    clock = VirtualClock()
+    Helper.clock = clock.time
+
+    saver = Saver.DBSaver()
+    if not saver.connect(args.user, password, args.dbname, check_schema=False):
+        parser.exit(1, "Connection failed\n")
+    Migrations.migrate(saver.con)
+
+    sman = SimulatedSensorManager()
+    sman.create_sensors()
+    ctrl = Controller()
+    ctrl.register_view(NullView())
+    ctrl.register_model(sman)
+    ctrl.checkpoint_path = os.path.join(tempfile.mkdtemp(prefix="soak"), "checkpoint.json")
+    ctrl.saver = saver
+    ctrl.user = args.user
+    saver.add_sensors(sman.sensor_ids)
+    saver.new_session()
+    ctrl.interval_time = QTime(0,0).addMSecs(int(args.interval * 1000))
+
+    cycles = int(args.days * 86400 / args.interval)
+    print("Session %d: %d cycles (%.1f virtual days)" % (saver.session_id, cycles, args.days))
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    samples = run(ctrl, clock, args.interval, min(args.warmup, cycles), args.sample_every, app)
+    snapshot = tracemalloc.take_snapshot()
+    samples += [dict(s, cycle=s["cycle"] + args.warmup) for s in run(ctrl, clock, args.interval, cycles - args.warmup, args.sample_every, app)]
+    stats = tracemalloc.take_snapshot().compare_to(snapshot, "lineno")
+    tracemalloc.stop()
+    ctrl.stop()
+    print("Wall time %.1f s" % (time.perf_counter() - start))
+
+    print("Top allocators after warm-up:")
+    for stat in stats[:args.top]:
+        print("  %s" % stat)
+
+    failures = check(samples, args.warmup, args)
+    diff = Rollup.verify(saver.con, saver.session_id)
+    if diff:
+        failures.append("Rebuild differs from incremental rollups in %d rows, e.g. %s" % (len(diff), diff[0]))
+    for failure in failures:
+        print("FAIL: %s" % failure)
+    if failures:
+        parser.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
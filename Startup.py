@@ -0,0 +1,125 @@
+"""
+Startup benchmark: import time, cold start and baseline RSS of the GUI.
+
+Every run starts a fresh interpreter which imports App, builds the main widgets
+(with a fixed sensor list, no hardware needed) and renders them once offscreen.
+The benchmark fails (exit code 1) if the median of the runs exceeds a budget
+or if heavy modules (numpy, psycopg2) are loaded before they are needed.
+
+Usage:
+python3 Startup.py --runs 5 --import-budget 500 --startup-budget 3000 --rss-budget 120
+python3 Startup.py --importtime    (show slowest imports)
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY = ["numpy", "psycopg2", "Saver"]
+DIR = os.path.dirname(os.path.abspath(__file__))
+
+def child():
+    """Cold start in this process, print measurements as json."""
+
+    start = time.perf_counter()
+    import App
+    from PyQt5.QtWidgets import QApplication, QMainWindow
+    imported = time.perf_counter()
+
+    app = QApplication([])
+    wman = App.WidgetManager()
+    ctrl = App.Controller()
+    wman.register_controller(ctrl)
+    widget = wman.create_widgets(["Keysight", "PT100_1", "PT100_2"], [1, 0, 0])
+    window = QMainWindow()
+    window.setCentralWidget(widget)
+    window.show()
+    app.processEvents()
+    ready = time.perf_counter()
+
+    with open("/proc/self/status") as f:
+        rss = [int(line.split()[1]) / 1024 for line in f if line.startswith("VmRSS:")][0]
+    print(json.dumps({
+                        "import_ms": (imported - start) * 1000,
+                        "ready_ms": (ready - start) * 1000,
+                        "rss_mb": rss,
+                        "eager": [m for m in HEAVY if m in sys.modules]
+                    }))
+
+def run_once():
+    """
+    Start child interpreter.
+
+    Return:
+    dict: measurements of child, wall_ms including interpreter start
+    """
+
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, os.path.join(DIR, "Startup.py"), "--child"], cwd=DIR, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    wall = time.perf_counter() - start
+    result = json.loads(out.strip().splitlines()[-1])
+    result["wall_ms"] = wall * 1000
+    return result
+
+def importtime(top):
+    """Print the top slowest imports of App (cumulative, python -X importtime)."""
+
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", "import App"], cwd=DIR,
+                         env=dict(os.environ, QT_QPA_PLATFORM="offscreen"), capture_output=True, text=True).stderr
+    rows = []
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.strip()))
+    for cumulative, name in sorted(rows, reverse=True)[:top]:
+        print("%8.1f ms  %s" % (cumulative / 1000, name))
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time and memory benchmark.")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget", type=float, default=500, help="max median import time of App in ms")
+    parser.add_argument("--startup-budget", type=float, default=3000, help="max median cold start (process start to rendered window) in ms")
+    parser.add_argument("--rss-budget", type=float, default=120, help="max median RSS after startup in MB")
+    parser.add_argument("--importtime", action="store_true", help="show slowest imports")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+    if args.importtime:
+        importtime(args.top)
+        return
+
+    results = [run_once() for _ in range(args.runs)]
+    import_ms = statistics.median(r["import_ms"] for r in results)
+    wall_ms = statistics.median(r["wall_ms"] for r in results)
+    rss_mb = statistics.median(r["rss_mb"] for r in results)
+    eager = sorted(set(m for r in results for m in r["eager"]))
+    print("import %.1f ms  cold start %.1f ms  rss %.1f MB  (median of %d runs)" % (import_ms, wall_ms, rss_mb, args.runs))
+
+    failures = []
+    if import_ms > args.import_budget:
+        failures.append("Import time %.1f ms exceeds budget %.1f ms" % (import_ms, args.import_budget))
+    if wall_ms > args.startup_budget:
+        failures.append("Cold start %.1f ms exceeds budget %.1f ms" % (wall_ms, args.startup_budget))
+    if rss_mb > args.rss_budget:
+        failures.append("RSS %.1f MB exceeds budget %.1f MB" % (rss_mb, args.rss_budget))
+    if eager:
+        failures.append("Loaded at startup: %s" % ", ".join(eager))
+    for failure in failures:
+        print("FAIL: %s" % failure)
+    if failures:
+        parser.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+SCPI transports for KeysightE4990A.
+
+A transport provides write(cmd), ask(cmd) and a timeout attribute.
+RecordingTransport logs every command/response pair with its timing from a live instrument,
+ReplayTransport plays such a recording back (at full speed or with the original timing),
+so the acquisition path can be benchmarked and regression tested without the analyzer.
+
+Usage:
+python3 Transport.py record session.jsonl --cycles 20 --profile monitor
+python3 Transport.py replay session.jsonl [--realtime]
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+class UsbtmcTransport():
+    """Live instrument connected via USB (usbtmc)."""
+
+    def __init__(self, addr):
+        # imported on use, replay works on machines without usbtmc
+        import usbtmc
+        self.instrument = usbtmc.Instrument(addr[0], addr[1])
+
+    @property
+    def timeout(self):
+        return self.instrument.timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self.instrument.timeout = value
+
+    def write(self, cmd):
+        self.instrument.write(cmd)
+
+    def ask(self, cmd):
+        return self.instrument.ask(cmd)
+
+class RecordingTransport():
+    """Pass commands to inner transport and log them to a json lines file."""
+
+    def __init__(self, inner, path):
+        self.inner = inner
+        self.file = open(path, "w")
+        self.start = time.perf_counter()
+
+    @property
+    def timeout(self):
+        return self.inner.timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self.inner.timeout = value
+
+    def __record(self, op, cmd, response, started):
+        now = time.perf_counter()
+        self.file.write(json.dumps({
+                                    "op": op,
+                                    "cmd": cmd,
+                                    "response": response,
+                                    "t": started - self.start,
+                                    "duration": now - started
+                                }) + "\n")
+
+    def write(self, cmd):
+        started = time.perf_counter()
+        self.inner.write(cmd)
+        self.__record("write", cmd, None, started)
+
+    def ask(self, cmd):
+        started = time.perf_counter()
+        response = self.inner.ask(cmd)
+        self.__record("ask", cmd, response, started)
+        return response
+
+    def close(self):
+        self.file.close()
+
+class ReplayMismatch(Exception):
+    """Command sent during replay differs from the recording."""
+
+class ReplayTransport():
+    """Play back a recording of RecordingTransport."""
+
+    def __init__(self, path, realtime=False):
+        """Load recording. With realtime, every command takes as long as recorded."""
+
+        with open(path) as f:
+            self.records = [json.loads(line) for line in f if line.strip()]
+        self.realtime = realtime
+        self.position = 0
+        self.timeout = None
+
+    def remaining(self):
+        """Return number of recorded commands not yet replayed."""
+
+        return len(self.records) - self.position
+
+    def rewind(self):
+        """Start replay from the beginning of the recording."""
+
+        self.position = 0
+
+    def __next(self, op, cmd):
+        if self.position >= len(self.records):
+            raise ReplayMismatch("Recording exhausted at %s %r" % (op, cmd))
+        record = self.records[self.position]
+        if record["op"] != op or record["cmd"] != cmd:
+            raise ReplayMismatch("Command %d: expected %s %r, got %s %r" % (self.position, record["op"], record["cmd"], op, cmd))
+        self.position += 1
+        if self.realtime:
+            time.sleep(record["duration"])
+        return record
+
+    def write(self, cmd):
+        self.__next("write", cmd)
+
+    def ask(self, cmd):
+        return self.__next("ask", cmd)["response"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Record or replay SCPI sessions of the Keysight E4990A.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    record = sub.add_parser("record", help="record measurement cycles of live instrument")
+    record.add_argument("path")
+    record.add_argument("--vid", type=int, default=2391)
+    record.add_argument("--pid", type=int, default=6153)
+    record.add_argument("--cycles", type=int, default=10)
+    record.add_argument("--profile", default="precise")
+    replay = sub.add_parser("replay", help="replay recording through the acquisition path")
+    replay.add_argument("path")
+    replay.add_argument("--profile", default="precise", help="profile used for recording")
+    replay.add_argument("--realtime", action="store_true", help="replay with recorded timing")
+    args = parser.parse_args()
+
+    from Sensors import KeysightE4990A
+
+    if args.command == "record":
+        transport = RecordingTransport(UsbtmcTransport([args.vid, args.pid]), args.path)
+        sensor = KeysightE4990A(None, args.profile, transport)
+        cycles = args.cycles
+    else:
+        transport = ReplayTransport(args.path, args.realtime)
+        start = time.perf_counter()
+        sensor = KeysightE4990A(None, args.profile, transport)
+        print("setup %.1f ms" % ((time.perf_counter() - start) * 1000))
+        cycles = None
+
+    latencies = []
+    shapes = set()
+    while cycles is None and transport.remaining() or cycles is not None and len(latencies) < cycles:
+        start = time.perf_counter()
+        event = sensor.read()
+        latencies.append(time.perf_counter() - start)
+        shapes.add(event["data"].shape)
+
+    if args.command == "record":
+        transport.close()
+    print("%d cycles  median %.2f ms  max %.2f ms  data shapes %s" % (len(latencies), statistics.median(latencies) * 1000, max(latencies) * 1000, sorted(shapes)))
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
-from PyQt5.QtGui import *
-from PyQt5.QtCore import *
-from PyQt5.QtWidgets import *
+from PyQt5.QtCore import Qt, QTime, QTimer
+from PyQt5.QtWidgets import QAbstractItemView, QAbstractSpinBox, QDateTimeEdit, QHeaderView, QLabel, QPushButton, \
+                            QSizePolicy, QTableWidget, QTimeEdit
 
 """Polymorphised Widgets that are used by the View."""
 
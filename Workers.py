@@ -0,0 +1,272 @@
+"""
+Process-isolated sensor drivers.
+
+IsolatedSensor runs a Sensor in its own worker process, supervised by the parent.
+A hanging or crashing driver (libusb, SPI) only takes down its worker, which is restarted
+on the next read. Measurement data is passed back through a shared-memory ring buffer,
+the pipe to the worker only carries small control messages.
+start_read()/finish_read() let several workers measure at the same time.
+
+Note: data of an event is a view into the ring buffer (no copy). It stays valid
+until the slot is reused, i.e. for the next slots - 1 reads of the same sensor.
+"""
+
+import multiprocessing
+import traceback
+from multiprocessing import shared_memory
+
+"""Sensor methods that change settings, their last call is repeated on a restarted worker."""
+REPLAY = ("set_coefficients", "apply_profile")
+
+class WorkerError(Exception):
+    """Worker process crashed, hung or raised an error."""
+
+def _worker(factory, args, kwargs, shm_name, slots, slot_size, conn):
+    """Main function of worker process: create sensor and answer requests of parent."""
+
+    import numpy as np
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        try:
+            sensor = factory(*args, **kwargs)
+        except Exception:
+            conn.send({"error": traceback.format_exc()})
+            return
+        info = {k: v for k, v in sensor.property.items() if k != "link"}
+        methods = [name for name in dir(sensor) if not name.startswith("_") and callable(getattr(sensor, name))]
+        attributes = [name for name in vars(sensor) if not name.startswith("_")]
+        conn.send({"property": info, "methods": methods, "attributes": attributes})
+
+        seq = 0
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                return
+            try:
+                if request[0] == "read":
+                    event = sensor.read()
+                    data = np.ascontiguousarray(event["data"], dtype=np.float64)
+                    event["data"] = None
+                    if data.nbytes <= slot_size:
+                        slot = seq % slots
+                        np.ndarray(data.shape, np.float64, shm.buf, slot * slot_size)[...] = data
+                        event["slot"] = slot
+                        event["shape"] = data.shape
+                    else:
+                        # too large for ring buffer, send inline
+                        event["data"] = data
+                    seq += 1
+                    conn.send({"event": event})
+                elif request[0] == "call":
+                    conn.send({"result": getattr(sensor, request[1])(*request[2], **request[3])})
+                elif request[0] == "getattr":
+                    conn.send({"result": getattr(sensor, request[1])})
+                elif request[0] == "stop":
+                    return
+            except Exception:
+                conn.send({"error": traceback.format_exc()})
+    finally:
+        shm.close()
+
+class IsolatedSensor():
+    """Proxy of a Sensor running in a worker process. Provides property, read() and public methods of the sensor."""
+
+    def __init__(self, factory, *args, slots=4, slot_size=1 << 20, timeout=180, **kwargs):
+        """
+        Start worker process creating factory(*args, **kwargs).
+
+        slots, slot_size: ring buffer of slots slots of slot_size bytes each.
+        timeout: seconds to wait for the worker before it counts as hung.
+        """
+
+        self._factory = factory
+        self._args = args
+        self._kwargs = kwargs
+        self._slots = slots
+        self._slot_size = slot_size
+        self._timeout = timeout
+        self._ctx = multiprocessing.get_context("spawn")
+        self._shm = shared_memory.SharedMemory(create=True, size=slots * slot_size)
+        self._process = None
+        self._conn = None
+        self._info = {}
+        self._methods = []
+        self._attributes = []
+        # last arguments of REPLAY methods: {name: (args, kwargs)}
+        self._replay = {}
+        self.restarts = 0
+        try:
+            self._start()
+        except:
+            self._kill()
+            self._shm.close()
+            self._shm.unlink()
+            raise
+
+    def _start(self):
+        """Start worker and wait for sensor setup."""
+
+        self._conn, child = self._ctx.Pipe()
+        self._process = self._ctx.Process(target=_worker, daemon=True,
+                                          args=(self._factory, self._args, self._kwargs, self._shm.name, self._slots, self._slot_size, child))
+        self._process.start()
+        child.close()
+        reply = self._receive()
+        self._info = reply["property"]
+        self._methods = reply["methods"]
+        self._attributes = reply["attributes"]
+
+    def _kill(self):
+        """Terminate worker."""
+
+        if self._process is not None and self._process.is_alive():
+            self._process.kill()
+        if self._process is not None:
+            self._process.join()
+        if self._conn is not None:
+            self._conn.close()
+        self._process = None
+        self._conn = None
+
+    def _receive(self):
+        """
+        Wait for reply of worker.
+
+        Return:
+        dict: reply
+        """
+
+        try:
+            if not self._conn.poll(self._timeout):
+                raise WorkerError("%s: worker not responding" % self._factory.__name__)
+            reply = self._conn.recv()
+        except (EOFError, OSError):
+            raise WorkerError("%s: worker died" % self._factory.__name__)
+        if "error" in reply:
+            raise WorkerError(reply["error"])
+        return reply
+
+    def _send(self, request):
+        """Send request to worker without waiting for the reply, restart worker if it is dead."""
+
+        if self._process is None or not self._process.is_alive():
+            self._restart()
+        try:
+            self._conn.send(request)
+        except OSError:
+            self._kill()
+            raise WorkerError("%s: worker died" % self._factory.__name__)
+
+    def _restart(self):
+        """Replace dead worker, restore settings of REPLAY calls on the new sensor."""
+
+        self._kill()
+        self.restarts += 1
+        try:
+            self._start()
+            for name, (args, kwargs) in self._replay.items():
+                self._conn.send(("call", name, args, kwargs))
+                self._receive()
+        except (WorkerError, OSError) as e:
+            self._kill()
+            raise WorkerError("%s: restart failed: %s" % (self._factory.__name__, e))
+
+    def _call(self, name, args, kwargs):
+        """Call method of sensor in worker, remember settings to restore after a restart."""
+
+        result = self._request(("call", name, args, kwargs))["result"]
+        if name in REPLAY:
+            self._replay[name] = (args, kwargs)
+        return result
+
+    def _reply(self):
+        """
+        Wait for reply to the request sent last.
+
+        Return:
+        dict: reply
+        """
+
+        try:
+            return self._receive()
+        except WorkerError:
+            # hung or crashed worker is replaced on next request
+            self._kill()
+            raise
+
+    def _request(self, request):
+        """
+        Send request to worker and wait for the reply.
+
+        Return:
+        dict: reply
+        """
+
+        self._send(request)
+        return self._reply()
+
+    @property
+    def property(self):
+        """Information about Sensor (without link)."""
+
+        return self._info.copy()
+
+    def start_read(self):
+        """Start reading sensor in worker, get the event with finish_read() (lets several workers measure at once)."""
+
+        self._send(("read",))
+
+    def finish_read(self):
+        """
+        Wait for reading started by start_read().
+
+        Return:
+        dict: event of Sensor.read(), data as np_array view into shared memory
+        """
+
+        import numpy as np
+        event = self._reply()["event"]
+        if event["data"] is None:
+            slot = event.pop("slot")
+            event["data"] = np.ndarray(event.pop("shape"), np.float64, self._shm.buf, slot * self._slot_size)
+        return event
+
+    def read(self):
+        """
+        Read sensor in worker.
+
+        Return:
+        dict: event of Sensor.read(), data as np_array view into shared memory
+        """
+
+        self.start_read()
+        return self.finish_read()
+
+    def __getattr__(self, name):
+        """Forward public methods and attributes to sensor in worker."""
+
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in self._methods:
+            return lambda *args, **kwargs: self._call(name, args, kwargs)
+        if name in self._attributes:
+            return self._request(("getattr", name))["result"]
+        raise AttributeError(name)
+
+    def close(self):
+        """Stop worker and release shared memory."""
+
+        if self._conn is not None:
+            try:
+                self._conn.send(("stop",))
+            except OSError:
+                pass
+            self._process.join(5)
+        self._kill()
+        try:
+            self._shm.close()
+        except BufferError:
+            # event data still referenced, mapping is released with the last view
+            pass
+        self._shm.unlink()
@@ -0,0 +1,49 @@
+import warnings
+import numpy as np
+import pytest
+import Align
+
+SOURCE_T = np.array([0.0, 10.0, 20.0, 20.0, 30.0])
+SOURCE_V = np.array([0.0, 1.0, 2.0, 4.0, 3.0])
+
+def interpolate(t, method, max_gap=None):
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        return Align.interpolate(np.asarray(t, dtype=np.float64), SOURCE_T, SOURCE_V, method, max_gap)
+
+@pytest.mark.parametrize("method", Align.METHODS)
+def test_exact_timestamps(method):
+    np.testing.assert_array_equal(interpolate([0, 10, 30], method), [0.0, 1.0, 3.0])
+
+@pytest.mark.parametrize("method", Align.METHODS)
+def test_duplicate_timestamp_takes_last_value(method):
+    np.testing.assert_array_equal(interpolate([20], method), [4.0])
+
+def test_linear_between_points():
+    np.testing.assert_allclose(interpolate([5, 15, 25], "linear"), [0.5, 1.5, 3.5])
+
+def test_previous_between_points():
+    np.testing.assert_array_equal(interpolate([5, 15, 25], "previous"), [0.0, 1.0, 4.0])
+
+def test_nearest_between_points():
+    np.testing.assert_array_equal(interpolate([4, 6, 26], "nearest"), [0.0, 1.0, 3.0])
+
+def test_out_of_range():
+    np.testing.assert_array_equal(interpolate([-5, 35], "linear"), [np.nan, np.nan])
+    np.testing.assert_array_equal(interpolate([-5, 35], "previous"), [np.nan, 3.0])
+    np.testing.assert_array_equal(interpolate([-5, 35], "nearest"), [0.0, 3.0])
+
+def test_max_gap():
+    source_t = np.array([0.0, 10.0, 100.0])
+    source_v = np.array([0.0, 1.0, 2.0])
+    t = np.array([5.0, 50.0, 100.0, 104.0])
+    np.testing.assert_allclose(Align.interpolate(t, source_t, source_v, "linear", 20), [0.5, np.nan, 2.0, np.nan])
+    np.testing.assert_array_equal(Align.interpolate(t, source_t, source_v, "previous", 20), [0.0, np.nan, 2.0, 2.0])
+    np.testing.assert_array_equal(Align.interpolate(t, source_t, source_v, "nearest", 20), [0.0, np.nan, 2.0, 2.0])
+
+def test_empty_source():
+    assert np.isnan(Align.interpolate(np.array([1.0]), np.empty(0), np.empty(0))).all()
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        interpolate([1], "cubic")
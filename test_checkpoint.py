@@ -0,0 +1,29 @@
+import pytest
+import Checkpoint
+
+def state(last_measurement=1000.0, interval_ms=60000):
+    return {"last_measurement": last_measurement, "interval_ms": interval_ms}
+
+@pytest.mark.parametrize("elapsed, missed, remaining_ms", [
+    (0.0, 0, 60000),
+    (0.5, 0, 59500),
+    (59.5, 0, 500),
+    (60.0, 1, 60000),
+    (60.5, 1, 59500),
+    (119.5, 1, 500),
+    (120.0, 2, 60000),
+    (3600.0, 60, 60000),
+])
+def test_missed_intervals(elapsed, missed, remaining_ms):
+    assert Checkpoint.missed_intervals(state(), 1000.0 + elapsed) == (missed, remaining_ms)
+
+def test_clock_before_last_measurement():
+    assert Checkpoint.missed_intervals(state(), 990.0) == (0, 60000)
+
+def test_save_load_clear(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    data = dict(state(), session_id=3, user="postgres", cnt=7, sensors=["A"], missed_intervals=0)
+    Checkpoint.save(data, path)
+    assert Checkpoint.load(path)["cnt"] == 7
+    Checkpoint.clear(path)
+    assert Checkpoint.load(path) is None
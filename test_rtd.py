@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+import RTD
+
+def resistance(t, coefficients=RTD.IEC_60751):
+    """Callendar-Van Dusen equation R(T)."""
+
+    r0, a, b, c = coefficients
+    c = c if t < 0 else 0.0
+    return r0 * (1 + a * t + b * t**2 + c * (t - 100) * t**3)
+
+@pytest.mark.parametrize("t", [-150.0, 0.0, 100.0, 500.0])
+def test_round_trip(t):
+    assert RTD.temperature(resistance(t)) == pytest.approx(t, abs=1e-6)
+
+def test_round_trip_array():
+    t = np.array([-150.0, 0.0, 100.0, 500.0])
+    r = np.array([resistance(x) for x in t])
+    np.testing.assert_allclose(RTD.temperature(r), t, atol=1e-6)
+
+def test_reference_values():
+    # IEC 60751 table: 0 *C = 100 Ohm, 100 *C = 138.5055 Ohm
+    assert resistance(0.0) == pytest.approx(100.0)
+    assert RTD.temperature(138.5055) == pytest.approx(100.0, abs=1e-3)
+
+def test_resistance_of_codes():
+    np.testing.assert_allclose(RTD.resistance([0, 16384, 32768]), [0.0, 215.0, 430.0])
+
+def test_fault_bits():
+    assert RTD.fault_bits([False] * 6) == 0
+    assert RTD.fault_bits([True, False, False, False, False, False]) == 0x80
+    assert RTD.fault_bits([False, False, False, False, False, True]) == 0x04